@@ -1,10 +1,12 @@
 #!/usr/bin/python3
 
 from argparse import ArgumentParser
-
-from src import Monitor, Report
 import logging
 
+# Совпадает с ключами Report._SUK_DICT; src не импортируется до разбора
+# аргументов, чтобы --help не загружал подсистемы
+SIZE_UNITS = ("B", "K", "M", "G", "T", "P")
+
 ap = ArgumentParser(description="Утилита для мониторинга работы ARM'а", add_help=False)
 
 ap.add_argument(
@@ -15,9 +17,9 @@ ap.add_argument(
 ap.add_argument(
     "-n",
     "--interval",
-    type = int,
+    type = float,
     default = 2,
-    help = "Интервал обновлений в сек. (если 0, будет сделан один снимок)",
+    help = "Интервал перерисовки экрана в сек. (если 0, будет сделан один снимок)",
 )
 ap.add_argument(
     "-u",
@@ -25,7 +27,7 @@ ap.add_argument(
     type = str,
     default = "B",
     help = "Авто-формат размеров (игнорирует -u)",
-    choices = Report._SUK_DICT,
+    choices = SIZE_UNITS,
 )
 ap.add_argument(
     "-h",
@@ -48,6 +50,7 @@ if __name__ == "__main__":
         ap.print_help()
         exit(0)
     logging.disable()
+    from src import Monitor, Report
     Report._READABLE_SIZE = ARGS.human_readable
     Report._SIZE_UNIT = ARGS.size_unit
     Report._COLORED = not ARGS.without_color
@@ -1,26 +1,46 @@
-from .modules import *
+import importlib
+
 from .config import (
     LOGGING_CONFIG,
     MAX_DISKUSAGE_PERC,
     INSPECTION_FREQUENCY
 )
 
+# Объекты подсистем загружаются при первом обращении, см. modules/__init__.py
+_EXPORTS = {
+    "MPLC4": ".modules",
+    "Journal": ".modules.mplc4.journal",
+    "Archive": ".modules.mplc4.archive",
+    "CurrentProject": ".modules.mplc4.current_project",
+    "ntuple_projectinfo": ".modules",
+    "ntuple_dbresult": ".modules",
+    "ntuple_pruneresult": ".modules",
+    "ArmReportMaker": ".modules",
+    "Scheduler": ".modules",
+    "System": ".modules",
+    "NotAFileError": ".modules",
+    "NotADirectoryError": ".modules",
+    "SystemService": ".modules",
+    "ServiceExistError": ".modules",
+    "Report": ".modules",
+    "Monitor": ".modules",
+}
+
 __all__ = [
     "LOGGING_CONFIG",
     "MAX_DISKUSAGE_PERC",
     "INSPECTION_FREQUENCY",
-    "MPLC4",
-    "Journal",
-    "Archive",
-    "CurrentProject",
-    "ntuple_projectinfo",
-    "ArmReportMaker",
-    "Scheduler",
-    "System",
-    "NotAFileError",
-    "NotADirectoryError",
-    "SystemService",
-    "ServiceExistError",
-    "Report",
-    "Monitor",
+    *_EXPORTS,
 ]
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
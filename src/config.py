@@ -13,14 +13,24 @@ try:
         level = cfg['logging']['level'],
     )
     MAX_DISKUSAGE_PERC: int = cfg["max_diskusage_perc"]
+    LOW_WATERMARK_PERC: int = cfg["low_watermark_perc"]
     INSPECTION_FREQUENCY: int = cfg["inspection_frequency"]
     EXIT_IF_FAILS: bool = cfg["exit_if_cleaning_fails"]
+    CLEANING_TIMEOUT: int = cfg["cleaning_timeout"]
+    EVENT_DRIVEN: bool = cfg["event_driven"]
+    FORECAST_CFG = cfg["forecast"]
+    BALLAST_CFG = cfg["ballast"]
+    EMERGENCY_CFG = cfg["emergency"]
     MPLC4_PATH: str = cfg["mplc4_path"]
     MPLC4_LOG_PATH: str = cfg["mplc4_log_path"]
+    MPLC4_LOG_KEEP_TAIL: int = cfg["mplc4_log_keep_tail"]
+    MPLC4_LOG_COMPRESSION = cfg["mplc4_log_compression"]
     SYS_LOG_PATH: str = cfg["sys_log_path"]
+    RECLAIM_DELETED_PREFIXES = tuple(cfg["reclaim_deleted_prefixes"])
     IGNORED_FILES = (
-        'start_log.txt'
+        'start_log.txt',
     )
+    RETENTION_CFG = cfg["retention"]
     PSQL_CFG = cfg["psql"]
 except Exception as error:
     logging.error(f' ошибка чтения конфига - "{error}", завершение работы..')
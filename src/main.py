@@ -2,16 +2,55 @@ import logging
 from .config import (
     LOGGING_CONFIG,
     MAX_DISKUSAGE_PERC,
+    LOW_WATERMARK_PERC,
     INSPECTION_FREQUENCY,
     EXIT_IF_FAILS,
+    CLEANING_TIMEOUT,
+    EVENT_DRIVEN,
+    MPLC4_LOG_PATH,
+    MPLC4_LOG_COMPRESSION,
+    SYS_LOG_PATH,
+    RECLAIM_DELETED_PREFIXES,
+    PSQL_CFG,
+    FORECAST_CFG,
+    RETENTION_CFG,
+    BALLAST_CFG,
+    EMERGENCY_CFG,
+)
+from .modules import (
+    Scheduler,
+    MPLC4,
+    System,
+    DiskWatcher,
+    DiskForecast,
+    CleanupPlanner,
+    Retention,
+    Ballast,
+    EmergencyCleaner,
 )
-from .modules import Scheduler, MPLC4, System
 
 
-# TODO В следующей версии переписать алгоритм очистки
 def main():
 
+    System.preflight()
     mplc = MPLC4()
+    forecast = DiskForecast(FORECAST_CFG["window"])
+    planner = CleanupPlanner()
+    retention = Retention(RETENTION_CFG["rules"])
+    ballast = None
+    if BALLAST_CFG["enabled"]:
+        ballast = Ballast(
+            BALLAST_CFG["path"], BALLAST_CFG["size"], BALLAST_CFG["critical_perc"]
+        )
+    emergency = None
+    if EMERGENCY_CFG["enabled"]:
+        emergency = EmergencyCleaner(
+            EMERGENCY_CFG["paths"],
+            EMERGENCY_CFG["critical_perc"],
+            EMERGENCY_CFG["target_perc"],
+            EMERGENCY_CFG["exclude"],
+        )
+    inspection_frequency = INSPECTION_FREQUENCY
 
     def is_limit_reached():
         diskspace_info = System.get_disk_usage()
@@ -21,28 +60,152 @@ def main():
         logging.info(msg)
         return out
 
-    @Scheduler.job
+    def forecast_time_to_limit():
+        """
+        Добавляет замер в прогноз, подстраивает частоту проверок
+        и возвращает прогнозируемое время до достижения лимита в секундах.
+        """
+        nonlocal inspection_frequency
+        diskspace_info = System.get_disk_usage()
+        forecast.add(diskspace_info.used)
+        time_to_limit = forecast.time_to(diskspace_info.total * MAX_DISKUSAGE_PERC / 100)
+        if time_to_limit is None:
+            # Диск не заполняется - постепенно реже проверяем
+            inspection_frequency *= 2
+        else:
+            inspection_frequency = time_to_limit / 10
+        inspection_frequency = min(
+            max(inspection_frequency, FORECAST_CFG["min_inspection_frequency"]),
+            FORECAST_CFG["max_inspection_frequency"],
+        )
+        Scheduler.set_period(manage_arm.__name__, inspection_frequency)
+        return time_to_limit
+
+    def rotate_archive(needed: int):
+        # Ротируются самые большие базы, покрывающие требуемый объём
+        sizes = mplc.archive.sizes
+        dbnames = None
+        if sizes:
+            dbnames = []
+            for name, size in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+                dbnames.append(name)
+                needed -= size
+                if needed <= 0:
+                    break
+        mplc.archive.rotate(
+            mplc.service if PSQL_CFG["rotate_stop_service"] else None, dbnames
+        )
+
+    def vacuum_journal(needed: int):
+        journal_size = System.get_journal_size(allocated=True) or 0
+        System.vacuum_journal_size(max(journal_size - needed, 0))
+
+    if RECLAIM_DELETED_PREFIXES:
+        planner.register(
+            "deleted_files",
+            cost = 1,
+            estimate = lambda: System.get_deleted_size(RECLAIM_DELETED_PREFIXES),
+            run = lambda needed: System.reclaim_deleted_files(RECLAIM_DELETED_PREFIXES),
+        )
+    planner.register(
+        "system_journal",
+        cost = 1,
+        estimate = lambda: System.get_journal_size(allocated=True),
+        run = vacuum_journal,
+    )
+    if MPLC4_LOG_COMPRESSION["enabled"]:
+        # Сначала сжатие, удаление старых сжатых файлов - если его не хватило
+        planner.register(
+            "mplc4_journal_compress",
+            cost = 2,
+            estimate = lambda: mplc.journal.compressible_size,
+            run = lambda needed: mplc.journal.compress(),
+        )
+        planner.register(
+            "mplc4_journal_compressed",
+            cost = 4,
+            estimate = lambda: mplc.journal.compressed_size,
+            run = mplc.journal.clear_compressed,
+        )
+    else:
+        planner.register(
+            "mplc4_journal",
+            cost = 2,
+            estimate = lambda: mplc.journal.deletable_size,
+            run = lambda needed: mplc.journal.clear(),
+        )
+    planner.register(
+        "mplc4_journal_truncate",
+        cost = 3,
+        estimate = lambda: mplc.journal.truncatable_size(),
+        run = lambda needed: mplc.journal.truncate_used(),
+    )
+    if PSQL_CFG["prune"]["vacuum_full"]:
+        # Без VACUUM FULL удаление записей не возвращает место системе,
+        # только останавливает рост архива (см. prune_archive)
+        planner.register(
+            "archive_prune",
+            cost = 5,
+            estimate = lambda: mplc.archive.prunable_size(),
+            run = lambda needed: mplc.archive.prune(needed=needed),
+        )
+    planner.register(
+        "archive_rotate",
+        cost = 20,
+        estimate = lambda: mplc.archive.size,
+        run = rotate_archive,
+    )
+
+    def release_emergency_space():
+        # Без запуска внешних процессов: сначала балласт, затем экстренная очистка
+        if ballast:
+            ballast.check()
+        if emergency:
+            emergency.check()
+
+    def on_disk_pressure():
+        Scheduler.trigger(manage_arm.__name__)
+
+    @Scheduler.job(timeout=CLEANING_TIMEOUT)
     def manage_arm():
+        release_emergency_space()
+        time_to_limit = forecast_time_to_limit()
         if not is_limit_reached():
-            logging.info("лимиты не достигнуты, пропуск")
-            return
-        for timestamp in (i * 3_600 for i in (24, 12, 6, 3, 1)):
-            logging.info(f"очистка записей системного журнала старше {timestamp} секунд")
-            System.vacuum_journal(timestamp)
-            if not is_limit_reached():
+            if time_to_limit is None or time_to_limit >= FORECAST_CFG["horizon"]:
+                logging.info("лимиты не достигнуты, пропуск")
+                if ballast:
+                    ballast.restore(LOW_WATERMARK_PERC)
                 return
-        logging.info("очистка журнала mplc")
-        mplc.journal.clear()
-        if not is_limit_reached():
-            return
-        logging.info("пересоздание архивных баз данных mplc")
-        mplc.service.stop()
-        mplc.archive.recreate()
-        mplc.service.start()
+            logging.warning(f"лимит будет достигнут через {time_to_limit:.0f} сек., досрочная очистка")
+        diskspace_info = System.get_disk_usage()
+        needed = diskspace_info.used - diskspace_info.total * LOW_WATERMARK_PERC / 100
+        planner.run(int(needed))
+        if ballast:
+            ballast.restore(LOW_WATERMARK_PERC)
         if not is_limit_reached():
             return
         logging.warning("после очистки лимиты всё ещё превышены")
         if EXIT_IF_FAILS:
             System.exit(3)
 
+    if retention.rules:
+        @Scheduler.job(period=RETENTION_CFG["period"])
+        def apply_retention():
+            retention.apply()
+
+    if PSQL_CFG["prune"]["period"]:
+        @Scheduler.job(period=PSQL_CFG["prune"]["period"])
+        def prune_archive():
+            mplc.archive.prune()
+
+    if EVENT_DRIVEN:
+        DiskWatcher(
+            (MPLC4_LOG_PATH, SYS_LOG_PATH, PSQL_CFG["data_path"]),
+            MAX_DISKUSAGE_PERC,
+            on_disk_pressure,
+            # Балласт и экстренная очистка проверяются на каждом событии,
+            # ограничение частоты касается только запуска manage_arm
+            on_check = release_emergency_space,
+        ).start()
+
     Scheduler.run(INSPECTION_FREQUENCY)
@@ -1,21 +1,50 @@
-from .mplc4 import MPLC4, ntuple_projectinfo
-from .arm_report_maker import ArmReportMaker
-from .scheduler import Scheduler
-from .system import System, NotAFileError, NotADirectoryError, ntuple_memusage
-from .system_service import SystemService, ServiceExistError
-from .monitor import Report, Monitor
+import importlib
 
-__all__ = [
-    "MPLC4",
-    "ntuple_projectinfo",
-    "ArmReportMaker",
-    "Scheduler",
-    "System",
-    "ntuple_memusage",
-    "NotAFileError",
-    "NotADirectoryError",
-    "SystemService",
-    "ServiceExistError",
-    "Report",
-    "Monitor",
-]
+# Подмодули загружаются при первом обращении к их объектам,
+# чтобы импорт пакета не тянул за собой все подсистемы
+_EXPORTS = {
+    "MPLC4": ".mplc4",
+    "ntuple_projectinfo": ".mplc4",
+    "ntuple_dbresult": ".mplc4",
+    "ntuple_pruneresult": ".mplc4",
+    "ArmReportMaker": ".arm_report_maker",
+    "Scheduler": ".scheduler",
+    "ntuple_jobstats": ".scheduler",
+    "System": ".system",
+    "ntuple_memusage": ".system",
+    "ntuple_meminfo": ".system",
+    "ntuple_cpuusage": ".system",
+    "ntuple_deletedfile": ".system",
+    "NotAFileError": ".system",
+    "NotADirectoryError": ".system",
+    "ProcFile": ".procfs",
+    "SystemService": ".system_service",
+    "ServiceExistError": ".system_service",
+    "ntuple_servicestatus": ".system_service",
+    "ntuple_cgroupstats": ".system_service",
+    "Report": ".monitor",
+    "Monitor": ".monitor",
+    "DiskWatcher": ".disk_watcher",
+    "DiskForecast": ".disk_forecast",
+    "CleanupPlanner": ".cleanup_planner",
+    "ntuple_actionresult": ".cleanup_planner",
+    "Ballast": ".ballast",
+    "EmergencyCleaner": ".emergency",
+    "Retention": ".retention",
+    "ntuple_retentionrule": ".retention",
+    "ntuple_retentionfile": ".retention",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,121 @@
+import logging
+import os
+
+from .system import System
+
+
+class Ballast:
+    """
+    Балластный файл - заранее выделенное место на диске,
+    которое освобождается мгновенно при критическом заполнении диска.
+
+    При заполнении диска до 100% внешние утилиты, от которых зависит
+    очистка (`journalctl`, `psql`), могут завершаться с ошибкой или
+    зависать. Удаление балласта сразу возвращает место, достаточное
+    для работы очистки и mplc4.
+
+    :param path: Путь к балластному файлу.
+    :type path: str
+    :param size: Размер балласта в байтах.
+    :type size: int
+    :param critical_perc: Процент использования диска,
+    при достижении которого балласт удаляется.
+    :type critical_perc: float
+    """
+
+    def __init__(self, path: str, size: int, critical_perc: float):
+        self._log_owner = self.__class__.__name__
+        self._path = path
+        self._size = size
+        self._critical_perc = critical_perc
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    @property
+    def size(self) -> int:
+        """
+        Возвращает занятый балластом объём в байтах (0, если балласта нет).
+
+        :rtype: int
+        """
+        try:
+            return os.stat(self._path).st_blocks * 512
+        except OSError:
+            return 0
+
+    def create(self) -> bool:
+        """
+        Создаёт балластный файл, выделяя место через `posix_fallocate`.
+        Если места не хватает, частично созданный файл удаляется.
+
+        :return: `True`, если балласт создан, иначе `False`.
+        :rtype: bool
+        """
+        partial = self._path + ".part"
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            fd = os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC, 0o600)
+            try:
+                os.posix_fallocate(fd, 0, self._size)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(partial, self._path)
+        except Exception as err:
+            logging.error(f"{self._log_owner}: не удалось создать балласт {self._path!r}: {err}")
+            try:
+                os.remove(partial)
+            except OSError:
+                pass
+            return False
+        logging.info(f"{self._log_owner}: создан балласт {self._path!r} ({self._size} байт)")
+        return True
+
+    def release(self) -> int:
+        """
+        Удаляет балластный файл.
+
+        :return: Освобождённый объём в байтах.
+        :rtype: int
+        """
+        size = self.size
+        try:
+            os.remove(self._path)
+        except FileNotFoundError:
+            return 0
+        except OSError as err:
+            logging.error(f"{self._log_owner}: не удалось удалить балласт {self._path!r}: {err}")
+            return 0
+        logging.warning(f"{self._log_owner}: балласт удалён, освобождено {size} байт")
+        return size
+
+    def check(self) -> int:
+        """
+        Удаляет балласт, если использование диска достигло критического порога.
+
+        :return: Освобождённый объём в байтах.
+        :rtype: int
+        """
+        usage = System.get_disk_usage()
+        if usage is None or usage.used / usage.total * 100 < self._critical_perc:
+            return 0
+        return self.release()
+
+    def restore(self, max_perc: float) -> bool:
+        """
+        Создаёт балласт заново, если его нет и после создания
+        использование диска останется ниже `max_perc` процентов.
+
+        :param max_perc: Допустимый процент использования диска с балластом.
+        :type max_perc: float
+        :return: `True`, если балласт на месте, иначе `False`.
+        :rtype: bool
+        """
+        if os.path.isfile(self._path):
+            return True
+        usage = System.get_disk_usage()
+        if usage is None or (usage.used + self._size) / usage.total * 100 >= max_perc:
+            return False
+        return self.create()
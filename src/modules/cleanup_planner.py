@@ -0,0 +1,117 @@
+from collections import namedtuple, deque
+import logging
+import time
+
+from .system import System
+
+ntuple_actionresult = namedtuple(
+    "ActionResult", "name estimated freed elapsed"
+)
+
+
+class _CleanupAction:
+
+    def __init__(self, name: str, cost: float, estimate, run):
+        self.name = name
+        self.cost = cost
+        self.estimate = estimate
+        self.run = run
+
+
+class CleanupPlanner:
+    """
+    Планировщик очистки диска.
+
+    Действия выполняются в порядке возрастания стоимости, пока
+    фактически освобождённый объём не покроет требуемый: более дорогое
+    действие выполняется, только если дешёвых не хватило. Оценки
+    используются лишь для пропуска действий, которым нечего освобождать.
+
+    :param history_size: Количество хранимых результатов действий.
+    :type history_size: int
+    """
+
+    def __init__(self, history_size: int = 100):
+        self._log_owner = self.__class__.__name__
+        self._actions = []
+        self._history = deque(maxlen=history_size)
+
+    @property
+    def history(self) -> tuple:
+        """
+        Возвращает результаты последних выполненных действий.
+
+        :rtype: tuple[ntuple_actionresult]
+        """
+        return tuple(self._history)
+
+    def register(self, name: str, cost: float, estimate, run):
+        """
+        Регистрирует действие очистки.
+
+        :param name: Имя действия.
+        :type name: str
+        :param cost: Относительная стоимость действия
+        (время выполнения и влияние на работу АРМ'а).
+        :type cost: float
+        :param estimate: Функция без аргументов, возвращающая объём
+        в байтах, который может освободить действие (`None` - неизвестно,
+        действие выполняется; 0 - действие пропускается).
+        :param run: Функция, выполняющая действие. Принимает объём
+        в байтах, который осталось освободить.
+        """
+        self._actions.append(_CleanupAction(name, cost, estimate, run))
+
+    def _estimate(self, action: _CleanupAction):
+        try:
+            return action.estimate()
+        except Exception as err:
+            logging.error(f"{self._log_owner}:{action.name}: ошибка оценки: {err}")
+            return 0
+
+    def run(self, needed: int) -> list:
+        """
+        Освобождает требуемый объём дискового пространства.
+
+        Действия выполняются по возрастанию стоимости. Оценка действия
+        запрашивается только перед его выполнением, то есть если
+        более дешёвых действий не хватило.
+
+        :param needed: Требуемый объём в байтах.
+        :type needed: int
+        :return: Результаты выполненных действий с фактически
+        освобождённым объёмом и временем выполнения.
+        :rtype: list[ntuple_actionresult]
+        """
+        results = []
+        if needed <= 0:
+            return results
+        logging.info(f"{self._log_owner}: требуется освободить {needed} байт")
+        for action in sorted(self._actions, key=lambda action: action.cost):
+            estimate = self._estimate(action)
+            if estimate == 0:
+                logging.info(f"{self._log_owner}:{action.name}: нечего освобождать, пропуск")
+                continue
+            used_before = System.get_disk_usage().used
+            started = time.monotonic()
+            try:
+                action.run(needed)
+            except Exception as err:
+                logging.error(f"{self._log_owner}:{action.name}: ошибка выполнения: {err}")
+            result = ntuple_actionresult(
+                action.name,
+                estimate,
+                used_before - System.get_disk_usage().used,
+                time.monotonic() - started,
+            )
+            logging.info(
+                f"{self._log_owner}:{action.name}: освобождено {result.freed} байт"
+                f" (оценка - {'?' if estimate is None else estimate})"
+                f" за {result.elapsed:.2f} сек."
+            )
+            results.append(result)
+            self._history.append(result)
+            needed -= result.freed
+            if needed <= 0:
+                break
+        return results
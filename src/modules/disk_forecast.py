@@ -0,0 +1,79 @@
+from collections import deque
+import time
+
+
+class DiskForecast:
+    """
+    Прогноз заполнения диска по скользящему окну замеров.
+
+    Скорость роста оценивается методом наименьших квадратов
+    по замерам за последние `window` секунд.
+
+    :param window: Ширина окна замеров в секундах.
+    :type window: float
+    :param min_span: Минимальный охват замеров в секундах,
+    начиная с которого строится прогноз.
+    :type min_span: float
+    """
+
+    def __init__(self, window: float = 900, min_span: float = 10):
+        self._window = window
+        self._min_span = min_span
+        self._samples = deque()
+
+    def add(self, used: int, timestamp: float = None):
+        """
+        Добавляет замер использования диска.
+
+        :param used: Занятое место в байтах.
+        :type used: int
+        :param timestamp: Время замера (`time.monotonic`),
+        по-умолчанию - текущее.
+        :type timestamp: float
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        self._samples.append((timestamp, used))
+        while self._samples and timestamp - self._samples[0][0] > self._window:
+            self._samples.popleft()
+
+    @property
+    def rate(self):
+        """
+        Возвращает скорость роста занятого места.
+
+        :return: Скорость в байтах в секунду или `None`,
+        если замеров недостаточно.
+        :rtype: float
+        """
+        if len(self._samples) < 2:
+            return None
+        t0 = self._samples[0][0]
+        if self._samples[-1][0] - t0 < self._min_span:
+            return None
+        count = len(self._samples)
+        mean_t = sum(t - t0 for t, _ in self._samples) / count
+        mean_u = sum(u for _, u in self._samples) / count
+        cov = sum((t - t0 - mean_t) * (u - mean_u) for t, u in self._samples)
+        var = sum((t - t0 - mean_t) ** 2 for t, _ in self._samples)
+        return cov / var if var else None
+
+    def time_to(self, limit: int):
+        """
+        Возвращает прогнозируемое время до достижения занятым местом
+        указанного объёма.
+
+        :param limit: Объём в байтах.
+        :type limit: int
+        :return: Время в секундах (0, если объём уже достигнут) или `None`,
+        если место не растёт или замеров недостаточно.
+        :rtype: float
+        """
+        if not self._samples:
+            return None
+        used = self._samples[-1][1]
+        if used >= limit:
+            return 0.0
+        rate = self.rate
+        if not rate or rate <= 0:
+            return None
+        return (limit - used) / rate
@@ -0,0 +1,189 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+from .system import System
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class DiskWatcher:
+    """
+    Отслеживает запись в директории через inotify и проверяет
+    использование диска только при поступлении событий.
+
+    События объединяются: использование диска проверяется
+    не чаще одного раза в `min_interval` секунд, сколько бы событий
+    ни пришло за это время. При превышении порога вызывается `callback`,
+    повторно - не раньше, чем через `cooldown` секунд. `on_check`
+    вызывается при каждой проверке без ограничения частоты - для
+    мгновенной реакции на критическое заполнение диска.
+
+    :param paths: Отслеживаемые директории (рекурсивно).
+    :type paths: Iterable[str]
+    :param threshold_perc: Порог использования диска в процентах.
+    :type threshold_perc: float
+    :param callback: Функция без аргументов, вызываемая при превышении порога.
+    :param min_interval: Минимальный интервал между проверками в секундах.
+    :type min_interval: float
+    :param cooldown: Минимальный интервал между вызовами `callback` в секундах.
+    :type cooldown: float
+    :param on_check: Функция без аргументов, вызываемая при каждой проверке.
+    """
+
+    _MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    _MAX_WATCHES = 4096
+
+    def __init__(
+            self,
+            paths,
+            threshold_perc: float,
+            callback,
+            min_interval: float = 0.2,
+            cooldown: float = 30.0,
+            on_check = None,
+        ):
+        self._log_owner = self.__class__.__name__
+        self._paths = tuple(paths)
+        self._threshold_perc = threshold_perc
+        self._callback = callback
+        self._min_interval = min_interval
+        self._cooldown = cooldown
+        self._on_check = on_check
+        self._libc = None
+        self._fd = None
+        self._watches = {}
+        self._limit_warned = False
+        self._thread = None
+
+    def _add_watch(self, path: str):
+        if len(self._watches) >= self._MAX_WATCHES:
+            if not self._limit_warned:
+                self._limit_warned = True
+                logging.warning(
+                    f"{self._log_owner}: достигнут предел наблюдений ({self._MAX_WATCHES}), "
+                    f"{path!r} и новые директории не отслеживаются"
+                )
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            logging.warning(f"{self._log_owner}: {path!r} не отслеживается: {os.strerror(err)}")
+            return
+        self._watches[wd] = path
+
+    def _add_tree(self, path: str):
+        """Добавляет наблюдение за директорией и всеми её поддиректориями."""
+        pending = [path]
+        while pending and len(self._watches) < self._MAX_WATCHES:
+            dirpath = pending.pop()
+            self._add_watch(dirpath)
+            try:
+                with os.scandir(dirpath) as entries:
+                    pending.extend(
+                        entry.path for entry in entries if entry.is_dir(follow_symlinks=False)
+                    )
+            except OSError:
+                continue
+
+    def _open(self):
+        """
+        Инициализирует inotify и добавляет наблюдения.
+
+        :raises OSError: Если inotify недоступен.
+        """
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = self._libc.inotify_init1(IN_CLOEXEC | IN_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        for path in self._paths:
+            if os.path.isdir(path):
+                self._add_tree(path)
+            else:
+                logging.warning(f"{self._log_owner}: директория {path!r} не найдена")
+        logging.info(f"{self._log_owner}: отслеживается директорий: {len(self._watches)}")
+
+    def _drain(self):
+        """Читает накопившиеся события, добавляя наблюдения за новыми директориями."""
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    logging.warning(f"{self._log_owner}: переполнение очереди событий")
+                elif mask & IN_IGNORED:
+                    # Директория удалена или размонтирована, ядро сняло наблюдение
+                    if self._watches.pop(wd, None) is not None:
+                        self._limit_warned = False
+                elif mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self._watches:
+                    self._add_tree(os.path.join(self._watches[wd], os.fsdecode(name)))
+
+    def _is_limit_reached(self) -> bool:
+        usage = System.get_disk_usage()
+        return usage is not None and usage.used / usage.total * 100 >= self._threshold_perc
+
+    def _run(self):
+        last_check = last_fired = float("-inf")
+        while True:
+            select.select([self._fd], [], [])
+            # Объединение событий: ждём окончания интервала и читаем всё накопленное
+            delay = last_check + self._min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._drain()
+            last_check = time.monotonic()
+            if self._on_check is not None:
+                try:
+                    self._on_check()
+                except Exception as err:
+                    logging.exception(f"{self._log_owner}: ошибка проверки: {err}")
+            if not self._is_limit_reached():
+                continue
+            if last_check - last_fired < self._cooldown:
+                continue
+            last_fired = last_check
+            logging.warning(f"{self._log_owner}: превышен порог использования диска")
+            try:
+                self._callback()
+            except Exception as err:
+                logging.exception(f"{self._log_owner}: ошибка обработчика: {err}")
+
+    def start(self) -> bool:
+        """
+        Запускает наблюдение в фоновом потоке.
+
+        :return: `True`, если наблюдение запущено, иначе `False`
+        (например, если inotify недоступен).
+        :rtype: bool
+        """
+        try:
+            self._open()
+        except Exception as err:
+            logging.error(f"{self._log_owner}: не удалось запустить наблюдение: {err}")
+            return False
+        self._thread = threading.Thread(target=self._run, name="disk-watcher", daemon=True)
+        self._thread.start()
+        return True
@@ -0,0 +1,119 @@
+import fnmatch
+import heapq
+import logging
+import os
+import stat
+import threading
+
+from .system import System
+from ..config import IGNORED_FILES
+
+
+class EmergencyCleaner:
+    """
+    Экстренная очистка при критическом заполнении диска.
+
+    Работает целиком внутри процесса, без запуска внешних утилит,
+    которые при нехватке памяти или места запускаются медленно
+    или не запускаются вовсе. За один обход директорий выбираются
+    самые большие файлы: неиспользуемые удаляются, у открытых
+    процессами освобождается место пробиванием дыры
+    (`System.truncate_head`), пока использование диска
+    не опустится до `target_perc`.
+
+    :param paths: Директории для очистки (рекурсивно).
+    :type paths: Iterable[str]
+    :param critical_perc: Процент использования диска,
+    при достижении которого выполняется очистка.
+    :type critical_perc: float
+    :param target_perc: Процент использования диска, до которого
+    выполняется очистка.
+    :type target_perc: float
+    :param exclude: Шаблоны имён файлов, которые не затрагиваются.
+    :type exclude: Iterable[str]
+    """
+
+    def __init__(self, paths, critical_perc: float, target_perc: float, exclude=()):
+        self._log_owner = self.__class__.__name__
+        self._paths = tuple(paths)
+        self._critical_perc = critical_perc
+        self._target_perc = target_perc
+        self._exclude = tuple(exclude) + tuple(IGNORED_FILES)
+        self._lock = threading.Lock()
+
+    def _scan(self) -> list:
+        """
+        Обходит директории и возвращает кучу файлов,
+        упорядоченных от самого большого.
+
+        :rtype: list[tuple[int, str]]
+        """
+        heap = []
+        pending = list(self._paths)
+        while pending:
+            dirpath = pending.pop()
+            try:
+                with os.scandir(dirpath) as entries:
+                    for entry in entries:
+                        try:
+                            entry_stat = entry.stat(follow_symlinks=False)
+                        except OSError:
+                            continue
+                        if stat.S_ISDIR(entry_stat.st_mode):
+                            pending.append(entry.path)
+                        elif stat.S_ISREG(entry_stat.st_mode) and not any(
+                            fnmatch.fnmatch(entry.name, exclude) for exclude in self._exclude
+                        ):
+                            heap.append((-entry_stat.st_blocks * 512, entry.path))
+            except OSError:
+                continue
+        heapq.heapify(heap)
+        return heap
+
+    def check(self) -> dict:
+        """
+        Выполняет очистку, если использование диска достигло
+        критического порога.
+
+        :return: Словарь вида {путь к файлу: освобождённый объём в байтах}.
+        :rtype: dict
+        """
+        usage = System.get_disk_usage()
+        if usage is None or usage.used / usage.total * 100 < self._critical_perc:
+            return {}
+        # Проверка вызывается и из наблюдателя inotify, и из manage_arm:
+        # если очистка уже идёт в другом потоке, повторно она не запускается
+        if not self._lock.acquire(blocking=False):
+            return {}
+        try:
+            return self._clean(usage)
+        finally:
+            self._lock.release()
+
+    def _clean(self, usage) -> dict:
+        needed = usage.used - usage.total * self._target_perc / 100
+        logging.critical(
+            f"{self._log_owner}: использовано {usage.used / usage.total * 100:.1f}%, "
+            f"экстренная очистка {needed:.0f} байт"
+        )
+        heap = self._scan()
+        used_files = System.get_used_files()
+        freed = {}
+        while heap and needed > 0:
+            size, path = heapq.heappop(heap)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            if (file_stat.st_dev, file_stat.st_ino) in used_files:
+                size = System.truncate_head(path)
+            else:
+                size = -size if System.remove_file(path) else None
+            if size:
+                freed[path] = size
+                needed -= size
+        logging.critical(
+            f"{self._log_owner}: освобождено {sum(freed.values())} байт, "
+            f"затронуто файлов: {len(freed)}"
+        )
+        return freed
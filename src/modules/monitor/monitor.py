@@ -1,5 +1,5 @@
+import asyncio
 from datetime import datetime
-from time import sleep
 
 from ..system import System
 from .report import Report
@@ -7,25 +7,37 @@ from .report import Report
 
 class Monitor:
 
-    _report = Report()
+    _report = None
 
     @classmethod
-    def run(cls, interval: int):
+    def _get_report(cls) -> Report:
+        if cls._report is None:
+            cls._report = Report()
+        return cls._report
+
+    @classmethod
+    async def _run_loop(cls, interval: float):
+        loop = asyncio.get_event_loop()
+        every = f"Every {interval:g} sec.."
+        while True:
+            started = loop.time()
+            await cls._get_report().collect(wait=interval)
+            width = Report._split_size(Report._OUT_WIDTH)
+            dt_now = datetime.now().strftime(Report._DT_FORMAT)
+            out = \
+                Report._align(every, "<", width[0]) + \
+                Report._align(dt_now, ">", width[1]) + \
+                f"\n{cls._report.render()}"
+            print("\033c" + out)
+            await asyncio.sleep(max(0, interval - (loop.time() - started)))
+
+    @classmethod
+    def run(cls, interval: float):
         if interval <= 0:
-            print(cls._report)
+            print(cls._get_report())
         else:
-            every = f"Every {interval} sec.."
-            while True:
-                try:
-                    width = Report._split_size(Report._OUT_WIDTH)
-                    dt_now = datetime.now().strftime(Report._DT_FORMAT)
-                    out = \
-                        Report._align(every, "<", width[0]) + \
-                        Report._align(dt_now, ">", width[1]) + \
-                        f"\n{cls._report}"
-                    print("\033c" + out)
-                    sleep(interval)
-                except KeyboardInterrupt:
-                    print("\n")
-                    break
+            try:
+                asyncio.run(cls._run_loop(interval))
+            except KeyboardInterrupt:
+                print("\n")
         System.exit(0)
@@ -1,7 +1,20 @@
+import asyncio
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
 import re
+import time
 
 from ..system import System
+from ..system_service import SystemService
 from ..mplc4 import MPLC4
+from ..disk_forecast import DiskForecast
+from ...config import MAX_DISKUSAGE_PERC, FORECAST_CFG
+
+ntuple_provider = namedtuple("Provider", "func refresh timeout")
+ntuple_cgrouprates = namedtuple(
+    "CgroupRates", "cpu_perc memory_current memory_peak io_read io_write pressure"
+)
 
 
 class Report:
@@ -31,6 +44,8 @@ class Report:
     _SUK_DICT = {"B": 0, "K": 10, "M": 20, "G": 30, "T": 40, "P": 50}
     _COLORED = True
     _OUT_WIDTH = 50
+    _PROVIDER_TIMEOUT = 5.0
+    _EXECUTOR_WORKERS = 16
     _err_out = "\x1b[1;31mERR\x1b[0m"
 
     @classmethod
@@ -99,20 +114,220 @@ class Report:
             return cls._err_out
         return cls._colored(state, cls._SERVICES_STATES_COLORS.get(state))
 
+    @classmethod
+    def _format_duration(cls, seconds):
+        if seconds is None:
+            return "-"
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        if hours:
+            out = f"{hours}h {minutes}m"
+        else:
+            out = f"{minutes}m {seconds}s"
+        return cls._colored(out, "red" if hours < 1 else "yellow" if hours < 24 else None)
+
     @classmethod
     def _format_title(cls, string: str):
         return cls._colored(f" {string} ", "faint")
 
     def __init__(self):
+        # Первый снимок CPU, от которого считается загрузка при выводе
+        System.sample_cpu()
         self._mplc = MPLC4()
+        self._services = (
+            self._mplc.archive.service,
+            self._mplc.service,
+            System.get_service("arm-cleaner"),
+        )
+        self._providers = {}
+        self._values = {}
+        self._stale = set()
+        self._last_refresh = {}
+        self._tasks = {}
+        # Вызовы в пуле потоков: {имя показателя: concurrent.futures.Future}
+        self._calls = {}
+        self._executor = None
+        self._forecast = DiskForecast(FORECAST_CFG["window"])
+        self._cgroup_samples = {}
+        self._register_default_providers()
 
-    def __str__(self):
+    async def _get_services_statuses(self) -> dict:
+        return await SystemService.get_statuses_async(self._services)
+
+    def _get_disk_usage(self):
+        usage = System.get_disk_usage()
+        if usage:
+            self._forecast.add(usage.used)
+        return usage
+
+    def _get_services_resources(self) -> dict:
+        """
+        Возвращает потребление ресурсов службами со скоростями,
+        вычисленными между текущим и предыдущим вызовом.
+
+        :return: Словарь вида {имя службы: ntuple_cgrouprates}.
+        Скорости CPU и ввода-вывода на первом вызове равны `None`,
+        для служб без cgroup значение - `None`.
+        :rtype: dict
+        """
+        now = time.monotonic()
+        resources = {}
+        for service in self._services:
+            stats = service.cgroup_stats
+            prev = self._cgroup_samples.get(service.name)
+            self._cgroup_samples[service.name] = (now, stats)
+            if stats is None:
+                resources[service.name] = None
+                continue
+            cpu_perc = io_read = io_write = None
+            if prev and prev[1] and now > prev[0]:
+                elapsed = now - prev[0]
+                prev_stats = prev[1]
+                # Счётчики уменьшаются, если служба перезапущена или сменился
+                # набор её экземпляров - скорость за такой интервал не выводится
+                if stats.cpu_usec is not None and prev_stats.cpu_usec is not None:
+                    if stats.cpu_usec >= prev_stats.cpu_usec:
+                        cpu_perc = (stats.cpu_usec - prev_stats.cpu_usec) / elapsed / 10**4
+                if stats.io_rbytes >= prev_stats.io_rbytes and stats.io_wbytes >= prev_stats.io_wbytes:
+                    io_read = (stats.io_rbytes - prev_stats.io_rbytes) / elapsed
+                    io_write = (stats.io_wbytes - prev_stats.io_wbytes) / elapsed
+            resources[service.name] = ntuple_cgrouprates(
+                cpu_perc,
+                stats.memory_current,
+                stats.memory_peak,
+                io_read,
+                io_write,
+                (stats.cpu_pressure, stats.memory_pressure, stats.io_pressure),
+            )
+        return resources
+
+    def _register_default_providers(self):
+        """
+        Регистрирует источники показателей отчёта.
+
+        Быстро меняющиеся и дешёвые показатели обновляются на каждом
+        кадре, запросы к psql и обходы директорий - раз в несколько десятков секунд.
+        """
+        mplc = self._mplc
+        self.register("project_info", lambda: mplc.project.info, 30)
+        self.register("services", self._get_services_statuses, 0)
+        self.register("cpu", System.get_cpu_usage, 0)
+        self.register("mem", System.get_mem_usage, 0)
+        self.register("disk", self._get_disk_usage, 0)
+        self.register("services_resources", self._get_services_resources, 0)
+        self.register("archive_size", lambda: mplc.archive.size, 60, 30.0)
+        self.register("journal_size", lambda: mplc.journal.size, 30)
+        self.register("sys_journal_size", System.get_journal_size, 30)
+        self.register("deleted_size", System.get_deleted_size, 10)
+
+    def register(self, name: str, func, refresh: float = 0, timeout: float = None):
+        """
+        Регистрирует источник показателя отчёта.
+
+        Корутины выполняются в цикле событий, обычные функции -
+        в пуле потоков, так как блокируют на вызовах ядра или psql.
+
+        :param name: Имя показателя.
+        :type name: str
+        :param func: Функция или корутина без аргументов,
+        возвращающая значение показателя (`None` - ошибка).
+        :param refresh: Минимальный интервал обновления в секундах,
+        между обновлениями выводится закэшированное значение.
+        :type refresh: float
+        :param timeout: Максимальное время получения значения
+        (по-умолчанию - `_PROVIDER_TIMEOUT`).
+        :type timeout: float
+        """
+        self._providers[name] = ntuple_provider(
+            func, refresh, timeout or self._PROVIDER_TIMEOUT
+        )
+
+    async def _refresh_provider(self, name: str, provider):
+        """
+        Обновляет значение одного показателя с ограничением по времени.
+
+        При ошибке сохраняется прежнее значение, помеченное как устаревшее.
+        Вызов в пуле потоков по истечении времени ожидания не прерывается,
+        новый вызов не запускается, пока он не завершится (см. `collect`).
+        """
+        value = None
+        try:
+            if asyncio.iscoroutinefunction(provider.func):
+                awaitable = provider.func()
+            else:
+                call = self._calls[name] = self._executor.submit(provider.func)
+                awaitable = asyncio.wrap_future(call)
+            value = await asyncio.wait_for(awaitable, provider.timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"{self.__class__.__name__}:{name}: исчерпан лимит ожидания")
+        except Exception as err:
+            logging.error(f"{self.__class__.__name__}:{name}: {err}")
+        if value is None:
+            self._stale.add(name)
+        else:
+            self._values[name] = value
+            self._stale.discard(name)
+
+    async def collect(self, wait: float = None):
+        """
+        Запускает обновление показателей, для которых истёк
+        интервал обновления, одновременно.
+
+        Показатель, не полученный за своё время ожидания, выводится
+        прежним значением с пометкой устаревшего (или как ошибка,
+        если значения ещё нет) и не задерживает остальные.
+
+        :param wait: Сколько секунд ждать завершения обновлений.
+        Незавершённые обновления продолжаются в фоне и попадут
+        в следующий кадр. По-умолчанию - до завершения всех.
+        :type wait: float
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._EXECUTOR_WORKERS, thread_name_prefix="report"
+            )
+        now = time.monotonic()
+        for name, provider in self._providers.items():
+            task = self._tasks.get(name)
+            if task is not None and not task.done():
+                continue
+            call = self._calls.get(name)
+            if call is not None and not call.done():
+                # Предыдущий вызов завис в пуле потоков - не занимаем ещё один поток
+                continue
+            last_refresh = self._last_refresh.get(name)
+            if last_refresh is not None and now - last_refresh < provider.refresh:
+                continue
+            self._last_refresh[name] = now
+            self._tasks[name] = asyncio.ensure_future(
+                self._refresh_provider(name, provider)
+            )
+        pending = [task for task in self._tasks.values() if not task.done()]
+        if pending:
+            await asyncio.wait(pending, timeout=wait)
+
+    def _value(self, name: str, format) -> str:
+        """
+        Возвращает отформатированное закэшированное значение показателя
+        с пометкой `~`, если последнее обновление не удалось.
+        """
+        out = format(self._values.get(name))
+        if name in self._stale and name in self._values:
+            out = self._colored("~", "faint") + out
+        return out
+
+    def render(self) -> str:
+        """
+        Формирует текст отчёта из закэшированных показателей.
+
+        :rtype: str
+        """
         width = self._split_size(self._OUT_WIDTH, 3)
         title = lambda s: self._align(s, "^", self._OUT_WIDTH, "-")
         pName = lambda s: self._align(s, "<", width[0])
         pValue = lambda s: self._align(s, ">", width[1])
 
-        def format(type: str, input):
+        def format(type: str, input=None):
             return {
                 "title": self._format_title,
                 "service_state": self._format_service_state,
@@ -120,24 +335,47 @@ class Report:
                 "size": self._format_size,
             }[type](input)
 
-        mplc = self._mplc
-        project_info = mplc.project.info
+        def usage_perc(usage):
+            return usage.used / usage.total * 100 if usage else None
+
+        def pressure(values):
+            if values is None or None in values:
+                return "-"
+            return "/".join(f"{value:.1f}" for value in values) + "%"
+
+        def service_lines(name: str, rates):
+            name = name.replace(".service", "")
+            if rates is None:
+                return (pName(name) + pValue(self._colored("-", "faint")),)
+            rate = lambda value: "-" if value is None else format("size", value) + "/s"
+            return (
+                pName(f"{name} CPU") + pValue(
+                    "-" if rates.cpu_perc is None else format("usage", rates.cpu_perc)
+                ),
+                pName(f"{name} RAM (peak)") + pValue(format("size", rates.memory_current) + (
+                    "" if rates.memory_peak is None else f" ({format('size', rates.memory_peak)})"
+                )),
+                pName(f"{name} IO r/w") + pValue(f"{rate(rates.io_read)} / {rate(rates.io_write)}"),
+                pName(f"{name} PSI") + pValue(pressure(rates.pressure)),
+            )
+
+        def fill_rate(rate):
+            if rate is None:
+                return "-"
+            return ("-" if rate < 0 else "") + format("size", abs(rate) * 3600) + "/h"
+
+        project_info = self._values.get("project_info")
         if project_info:
             project_name = project_info.name
             project_lastmod = project_info.last_modified_time.strftime(self._DT_FORMAT)
         else:
             project_name = project_lastmod = self._colored("None", "red")
-        services = (
-            mplc.archive.service,
-            mplc.service,
-            System.get_service("arm-cleaner")
+        services_statuses = self._values.get("services") or dict.fromkeys(
+            service.name for service in self._services
+        )
+        services_resources = self._values.get("services_resources") or dict.fromkeys(
+            service.name for service in self._services
         )
-        cpu_usage_perc = System.get_cpu_usage()
-        mem_usage = System.get_mem_usage()
-        mem_usage_perc = mem_usage.used / mem_usage.total * 100
-        diskspace_usage = System.get_disk_usage()
-        diskspace_usage_perc = diskspace_usage.used / diskspace_usage.total * 100
-        sys_journal_size = System.get_journal_size()
 
         lines = (
             "",
@@ -149,22 +387,42 @@ class Report:
             title(format("title", "Services")),
             "",
             *(
-                pName(service.name.replace(".service", "")) + \
-                pValue(format("service_state", service.state)) \
-                for service in services
+                pName(name.replace(".service", "")) + \
+                pValue(format("service_state", status and status.active)) \
+                for name, status in services_statuses.items()
+            ),
+            "",
+            title(format("title", "Services resources")),
+            "",
+            *(
+                line
+                for name, rates in services_resources.items()
+                for line in service_lines(name, rates)
             ),
             "",
             title(format("title", "System resources")),
             "",
-            pName("CPU") + pValue(format("usage", cpu_usage_perc)),
-            pName("RAM") + pValue(format("usage", mem_usage_perc)),
-            pName("Diskspace") + pValue(format("usage", diskspace_usage_perc)),
+            pName("CPU") + pValue(self._value("cpu", lambda v: format("usage", v))),
+            pName("RAM") + pValue(self._value("mem", lambda v: format("usage", usage_perc(v)))),
+            pName("Diskspace") + pValue(self._value("disk", lambda v: format("usage", usage_perc(v)))),
+            pName(f"Time to {MAX_DISKUSAGE_PERC}%") + pValue(self._value(
+                "disk",
+                lambda v: self._format_duration(
+                    self._forecast.time_to(v.total * MAX_DISKUSAGE_PERC / 100)
+                ) if v else self._err_out,
+            )),
             "",
             title(format("title", "Diskspace usage details")),
             "",
-            pName("General") + pValue(format("size", diskspace_usage[1::-1])),
-            pName("MPLC4 Archive") + pValue(format("size", mplc.archive.size)),
-            pName("MPLC4 Journal") + pValue(format("size", mplc.journal.size)),
-            pName("System Journal") + pValue(format("size", sys_journal_size)),
+            pName("General") + pValue(self._value("disk", lambda v: format("size", v and v[1::-1]))),
+            pName("Fill rate") + pValue(fill_rate(self._forecast.rate)),
+            pName("MPLC4 Archive") + pValue(self._value("archive_size", lambda v: format("size", v))),
+            pName("MPLC4 Journal") + pValue(self._value("journal_size", lambda v: format("size", v))),
+            pName("System Journal") + pValue(self._value("sys_journal_size", lambda v: format("size", v))),
+            pName("Deleted but open") + pValue(self._value("deleted_size", lambda v: format("size", v))),
         )
         return "\n".join(lines) + "\n"
+
+    def __str__(self):
+        asyncio.run(self.collect())
+        return self.render()
@@ -1,7 +1,10 @@
 from .mplc4 import MPLC4
 from .current_project import ntuple_projectinfo
+from .archive import ntuple_dbresult, ntuple_pruneresult
 
 __all__ = [
     "MPLC4",
     "ntuple_projectinfo",
+    "ntuple_dbresult",
+    "ntuple_pruneresult",
 ]
@@ -1,59 +1,539 @@
-import subprocess
+from collections import namedtuple
+import logging
+import threading
+import time
 
+from .psql import PsqlPool, PsqlSession, PsqlError
+from ..scheduler import Scheduler
 from ..system import System
 from ...config import PSQL_CFG
 
-SHELL_PSQL_TEMPLATE = "sudo psql -U {} -c {!r}"
-DBS_SIZES = """SELECT pg_database.datname AS name, \
-pg_database_size(pg_database.datname) AS size \
-FROM pg_database ORDER by size DESC;"""
+ntuple_dbresult = namedtuple(
+    "DbResult", "name ok elapsed error"
+)
+ntuple_pruneresult = namedtuple(
+    "PruneResult", "name rows reusable reclaimed elapsed error"
+)
+
+DBS_SIZES = """SELECT datname, pg_database_size(datname) \
+FROM pg_database WHERE datname IN ({names})"""
 CREATE_DB = "CREATE DATABASE {dbname} OWNER {owner}"
 DROP_DB = "DROP DATABASE IF EXISTS {dbname}"
+EXISTING_DBS = "SELECT datname FROM pg_database"
+RENAME_DB = "ALTER DATABASE {dbname} RENAME TO {new_name}"
+ALLOW_CONNECTIONS = "ALTER DATABASE {dbname} WITH ALLOW_CONNECTIONS {allow}"
+TERMINATE_CONNECTIONS = """SELECT pg_terminate_backend(pid) FROM pg_stat_activity \
+WHERE datname = '{dbname}' AND pid <> pg_backend_pid()"""
+CURRENT_DB_SIZE = "SELECT pg_database_size(current_database())"
+PRUNE_TABLES = """SELECT DISTINCT ON (table_schema, table_name) \
+quote_ident(table_schema) || '.' || quote_ident(table_name), quote_ident(column_name) \
+FROM information_schema.columns WHERE column_name IN ({columns}) \
+AND data_type LIKE 'timestamp%' \
+AND table_schema NOT IN ('pg_catalog', 'information_schema') \
+ORDER BY table_schema, table_name, column_name"""
+# Начало самого старого диапазона и количество диапазонов по {step} секунд
+# до горизонта хранения
+PRUNE_RANGES = """SELECT min({column})::timestamptz, ceil(extract(epoch FROM \
+now() - interval '{days} days' - min({column})::timestamptz) / {step})::int \
+FROM {table} WHERE {column} < now() - interval '{days} days'"""
+PRUNE_RANGE = """WITH deleted AS (DELETE FROM {table} \
+WHERE {column} >= '{start}'::timestamptz + interval '{lo} seconds' \
+AND {column} < least('{start}'::timestamptz + interval '{hi} seconds', now() - interval '{days} days') \
+RETURNING 1) SELECT count(*) FROM deleted"""
+ROW_SIZE = """SELECT (pg_total_relation_size(oid) / greatest(reltuples, 1))::bigint \
+FROM pg_class WHERE oid = '{table}'::regclass"""
+TABLE_SIZE = "SELECT pg_total_relation_size('{table}'::regclass)"
+SET_TIMEOUTS = "SET lock_timeout = '{lock}s'; SET statement_timeout = '{statement}s'"
+VACUUM_TABLE = "VACUUM {full}{table}"
+# Размер таблицы, умноженный на долю устаревших записей в выборке
+# около 1000 страниц (TABLESAMPLE SYSTEM читает только выбранные страницы)
+PRUNE_ESTIMATE = """SELECT (pg_total_relation_size('{table}'::regclass) * coalesce(\
+(SELECT avg(({column} < now() - interval '{days} days')::int) FROM {table} \
+TABLESAMPLE SYSTEM (least(100, 1000 * 100.0 / greatest(pg_relation_size('{table}'::regclass) / 8192, 1)))), \
+0))::bigint"""
+ROTATE_NEW_SUFFIX = "_rotate_new"
+ROTATE_OLD_SUFFIX = "_rotate_old"
+
+
+class _PruneBudget:
+    """
+    Общий для потоков очистки объём, который осталось освободить
+    (`None` - без ограничения).
+    """
+
+    def __init__(self, needed: int = None):
+        self._left = needed
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self) -> bool:
+        return self._left is not None and self._left <= 0
+
+    def spend(self, size: int):
+        with self._lock:
+            if self._left is not None:
+                self._left -= size
 
 
-# FIXME Весь класс на костылях, переписать
 class Archive:
 
     def __init__(self):
-        # self._log_owner = self.__class__.__name__
+        self._log_owner = self.__class__.__name__
         self._service = System.get_service("postgresql")
+        self._psql = PsqlPool(
+            PSQL_CFG["user"],
+            size = PSQL_CFG["workers"],
+            timeout = PSQL_CFG["timeout"],
+        )
 
     @property
     def service(self):
         return self._service
 
-    def _run_sql_cmd(self, cmd: str, capture_output: bool = False):
-        std = subprocess.DEVNULL if not capture_output else subprocess.PIPE
-        return subprocess.run(
-            SHELL_PSQL_TEMPLATE.format(PSQL_CFG["user"], cmd),
-            shell=True,
-            text=capture_output,
-            stdout=std,
-            stderr=std,
-        )
+    def _run_sql_cmd(self, cmd: str, types: tuple = None, session=None):
+        return (session or self._psql).execute(cmd, types)
 
-    def _create_db(self, name: str):
+    def _create_db(self, name: str, session=None):
         owner = "security" if "security" in name else "technology"
-        self._run_sql_cmd(CREATE_DB.format(dbname=name, owner=owner))
+        self._run_sql_cmd(CREATE_DB.format(dbname=name, owner=owner), session=session)
+
+    def _drop_db(self, name: str, session=None):
+        self._run_sql_cmd(DROP_DB.format(dbname=name), session=session)
+
+    @property
+    def sizes(self):
+        """
+        Возвращает размеры управляемых баз данных.
 
-    def _drop_db(self, name: str):
-        self._run_sql_cmd(DROP_DB.format(dbname=name))
+        :return: Словарь вида {имя базы: размер в байтах}
+        или `None`, если получить размеры не удалось.
+        :rtype: dict
+        """
+        names = ", ".join(f"'{name}'" for name in PSQL_CFG["manage_dbs"])
+        try:
+            return dict(self._run_sql_cmd(DBS_SIZES.format(names=names), (str, int)))
+        except PsqlError as err:
+            logging.error(f"{self._log_owner}:sizes: {err}")
 
     @property
     def size(self):
-        shell = self._run_sql_cmd(DBS_SIZES, True)
-        if shell.returncode:
+        sizes = self.sizes
+        if sizes is None:
             return None
-        name_size_gen = (
-            map(str.strip, line.split(" |")) \
-            for line in shell.stdout.split("\n")[2:-3]
-        )
-        return sum(
-            int(size) for name, size in name_size_gen \
-            if name in PSQL_CFG["manage_dbs"]
+        return sum(sizes.values())
+
+    def _recreate_db(self, dbname: str):
+        """
+        Пересоздаёт одну базу данных в отдельной сессии пула.
+
+        :param dbname: Имя базы данных.
+        :type dbname: str
+        :return: Результат пересоздания базы.
+        :rtype: ntuple_dbresult
+        """
+        started = time.monotonic()
+        try:
+            with self._psql.session() as session:
+                self._drop_db(dbname, session)
+                self._create_db(dbname, session)
+            result = ntuple_dbresult(dbname, True, time.monotonic() - started, None)
+            logging.info(f"{self._log_owner}:recreate:{dbname}: пересоздана за {result.elapsed:.2f} сек.")
+        except PsqlError as err:
+            result = ntuple_dbresult(dbname, False, time.monotonic() - started, f"{err}")
+            logging.error(f"{self._log_owner}:recreate:{dbname}: {err}")
+        return result
+
+    def recreate(self, dbnames: list = None, workers: int = None) -> list:
+        """
+        Пересоздаёт управляемые базы данных параллельно.
+
+        :param dbnames: Имена баз данных (по-умолчанию - все управляемые базы).
+        :type dbnames: list
+        :param workers: Количество параллельных потоков, не больше
+        размера пула сессий (по-умолчанию - размер пула).
+        :type workers: int
+        :return: Результаты пересоздания в порядке `dbnames`.
+        :rtype: list[ntuple_dbresult]
+        """
+        dbnames = PSQL_CFG["manage_dbs"] if dbnames is None else dbnames
+        if not dbnames:
+            return []
+        workers = min(workers or self._psql.size, self._psql.size, len(dbnames))
+        started = time.monotonic()
+        with Scheduler.thread_pool(workers) as executor:
+            results = list(executor.map(self._recreate_db, dbnames))
+        failed = sum(not result.ok for result in results)
+        msg = f"пересоздано {len(results) - failed}/{len(results)} баз" \
+            f" за {time.monotonic() - started:.2f} сек."
+        if failed:
+            logging.warning(f"{self._log_owner}:recreate: {msg}")
+        else:
+            logging.info(f"{self._log_owner}:recreate: {msg}")
+        return results
+
+    def _prepare_db(self, dbname: str):
+        """
+        Создаёт пустую базу-замену под временным именем.
+
+        Остатки прошлой прерванной ротации удаляются.
+
+        :param dbname: Имя ротируемой базы данных.
+        :type dbname: str
+        :return: Результат подготовки базы.
+        :rtype: ntuple_dbresult
+        """
+        started = time.monotonic()
+        try:
+            with self._psql.session() as session:
+                self._drop_db(dbname + ROTATE_NEW_SUFFIX, session)
+                self._drop_db(dbname + ROTATE_OLD_SUFFIX, session)
+                self._create_db(dbname + ROTATE_NEW_SUFFIX, session)
+            return ntuple_dbresult(dbname, True, time.monotonic() - started, None)
+        except PsqlError as err:
+            logging.error(f"{self._log_owner}:rotate:{dbname}: ошибка подготовки: {err}")
+            return ntuple_dbresult(dbname, False, time.monotonic() - started, f"{err}")
+
+    def _rename_db(self, session, dbname: str, new_name: str, attempts: int = 20):
+        """
+        Переименовывает базу данных, повторяя попытку, пока завершаются
+        отключённые от неё сеансы.
+        """
+        for attempt in range(attempts):
+            try:
+                return self._run_sql_cmd(
+                    RENAME_DB.format(dbname=dbname, new_name=new_name), session=session
+                )
+            except PsqlError as err:
+                if "being accessed" not in f"{err}" or attempt == attempts - 1:
+                    raise
+                time.sleep(0.1)
+
+    def _swap_db(self, session, dbname: str, exists: bool):
+        """
+        Подменяет базу данных подготовленной базой-заменой.
+
+        Подключения к базе запрещаются и завершаются, база переименовывается
+        во временное имя, а замена получает её имя. При ошибке исходное
+        состояние восстанавливается.
+
+        :return: Результат подмены базы.
+        :rtype: ntuple_dbresult
+        """
+        started = time.monotonic()
+        old_name, new_name = dbname + ROTATE_OLD_SUFFIX, dbname + ROTATE_NEW_SUFFIX
+        renamed = False
+        try:
+            if exists:
+                self._run_sql_cmd(ALLOW_CONNECTIONS.format(dbname=dbname, allow="false"), session=session)
+                self._run_sql_cmd(TERMINATE_CONNECTIONS.format(dbname=dbname), session=session)
+                self._rename_db(session, dbname, old_name)
+                renamed = True
+            self._rename_db(session, new_name, dbname)
+            return ntuple_dbresult(dbname, True, time.monotonic() - started, None)
+        except PsqlError as err:
+            logging.error(f"{self._log_owner}:rotate:{dbname}: ошибка подмены: {err}")
+            try:
+                if renamed:
+                    self._rename_db(session, old_name, dbname)
+                if exists:
+                    self._run_sql_cmd(ALLOW_CONNECTIONS.format(dbname=dbname, allow="true"), session=session)
+            except PsqlError as restore_err:
+                logging.critical(f"{self._log_owner}:rotate:{dbname}: ошибка восстановления: {restore_err}")
+            return ntuple_dbresult(dbname, False, time.monotonic() - started, f"{err}")
+
+    def _drop_dbs(self, dbnames: list, workers: int):
+        def drop(dbname: str):
+            try:
+                self._drop_db(dbname)
+            except PsqlError as err:
+                logging.error(f"{self._log_owner}:rotate:{dbname}: ошибка удаления: {err}")
+        if dbnames:
+            with Scheduler.thread_pool(min(workers, len(dbnames))) as executor:
+                tuple(executor.map(drop, dbnames))
+
+    def rotate(self, service=None, dbnames: list = None, workers: int = None) -> list:
+        """
+        Заменяет управляемые базы данных пустыми без длительного простоя.
+
+        Пустые базы-замены создаются параллельно под временными именами,
+        пока среда исполнения продолжает работать. Затем базы подменяются
+        переименованием, а старые базы удаляются уже после подмены.
+
+        :param service: Служба, останавливаемая только на время подмены.
+        Если не передана, подключения к базам завершаются принудительно.
+        :type service: SystemService
+        :param dbnames: Имена баз данных (по-умолчанию - все управляемые базы).
+        :type dbnames: list
+        :param workers: Количество параллельных потоков, не больше
+        размера пула сессий (по-умолчанию - размер пула).
+        :type workers: int
+        :return: Результаты ротации в порядке `dbnames`.
+        :rtype: list[ntuple_dbresult]
+        """
+        _log_owner = f"{self._log_owner}:rotate"
+        dbnames = PSQL_CFG["manage_dbs"] if dbnames is None else dbnames
+        if not dbnames:
+            return []
+        workers = min(workers or self._psql.size, self._psql.size, len(dbnames))
+        started = time.monotonic()
+        with Scheduler.thread_pool(workers) as executor:
+            prepared = list(executor.map(self._prepare_db, dbnames))
+        logging.info(f"{_log_owner}: базы-замены подготовлены за {time.monotonic() - started:.2f} сек.")
+
+        try:
+            existing = {row[0] for row in self._run_sql_cmd(EXISTING_DBS)}
+        except PsqlError as err:
+            logging.error(f"{_log_owner}: {err}")
+            self._drop_dbs([r.name + ROTATE_NEW_SUFFIX for r in prepared if r.ok], workers)
+            return [
+                r if not r.ok else r._replace(ok=False, error=f"{err}") for r in prepared
+            ]
+
+        swap_started = time.monotonic()
+        if service is not None:
+            service.stop()
+        try:
+            with self._psql.session() as session:
+                results = [
+                    self._swap_db(session, r.name, r.name in existing) if r.ok else r
+                    for r in prepared
+                ]
+        finally:
+            if service is not None:
+                service.start()
+        logging.info(f"{_log_owner}: подмена баз заняла {time.monotonic() - swap_started:.2f} сек.")
+
+        self._drop_dbs(
+            [r.name + (ROTATE_OLD_SUFFIX if r.ok else ROTATE_NEW_SUFFIX) for r in results],
+            workers,
         )
+        failed = sum(not r.ok for r in results)
+        msg = f"ротировано {len(results) - failed}/{len(results)} баз" \
+            f" за {time.monotonic() - started:.2f} сек."
+        if failed:
+            logging.warning(f"{_log_owner}: {msg}")
+        else:
+            logging.info(f"{_log_owner}: {msg}")
+        return results
+
+    def _prune_table(self, session, table: str, column: str, horizon_days: int, budget) -> tuple:
+        """
+        Удаляет из таблицы записи старше горизонта хранения,
+        начиная с самых старых.
+
+        Записи удаляются диапазонами времени по `chunk_hours` часов,
+        каждый диапазон - отдельной транзакцией, поэтому блокировки
+        короткие, а прирост WAL ограничен. Границы диапазонов
+        вычисляются один раз, и каждый DELETE читает только свой
+        диапазон, не просматривая повторно уже удалённые записи.
+
+        :return: Количество удалённых записей и их оценочный объём в байтах.
+        :rtype: tuple[int, int]
+        """
+        cfg = PSQL_CFG["prune"]
+        step = int(cfg["chunk_hours"] * 3600)
+        days = int(horizon_days)
+        start, ranges = session.execute(
+            PRUNE_RANGES.format(table=table, column=column, days=days, step=step), (str, int)
+        )[0]
+        if start is None:
+            return 0, 0
+        row_size = session.execute(ROW_SIZE.format(table=table), (int,))[0][0] or 0
+        table_rows = 0
+        for lo in range(0, ranges * step, step):
+            if budget.exhausted:
+                break
+            rows = session.execute(
+                PRUNE_RANGE.format(
+                    table=table, column=column, start=start, lo=lo, hi=lo + step, days=days
+                ),
+                (int,),
+            )[0][0]
+            table_rows += rows
+            budget.spend(rows * row_size)
+        return table_rows, table_rows * row_size
+
+    def _vacuum_table(self, session, table: str, dbname: str):
+        """
+        Выполняет VACUUM таблицы после удаления записей.
 
-    def recreate(self):
-        for dbname in PSQL_CFG["manage_dbs"]:
-            self._drop_db(dbname)
-            self._create_db(dbname)
+        Обычный VACUUM не блокирует таблицу, но освобождённое место
+        остаётся доступным для новых записей внутри PostgreSQL
+        и системе не возвращается. VACUUM FULL (`prune.vacuum_full`)
+        переписывает таблицу целиком под исключительной блокировкой
+        и возвращает место системе, поэтому выполняется, только если
+        на диске хватает места для копии таблицы; при ошибке
+        (в том числе по `lock_timeout`) выполняется обычный VACUUM.
+        """
+        cfg = PSQL_CFG["prune"]
+        _log_owner = f"{self._log_owner}:prune:{dbname}"
+        timeout = cfg["vacuum_timeout"] + PSQL_CFG["timeout"]
+        if cfg["vacuum_full"]:
+            table_size = session.execute(TABLE_SIZE.format(table=table), (int,))[0][0]
+            usage = System.get_disk_usage()
+            if usage is None or table_size >= usage.free:
+                logging.warning(
+                    f"{_log_owner}: для VACUUM FULL {table} недостаточно места "
+                    f"(таблица - {table_size} байт), выполняется обычный VACUUM"
+                )
+            else:
+                try:
+                    session.execute(VACUUM_TABLE.format(full="FULL ", table=table), timeout=timeout)
+                    return
+                except PsqlError as err:
+                    logging.warning(
+                        f"{_log_owner}: VACUUM FULL {table} не выполнен: {err}, "
+                        f"выполняется обычный VACUUM"
+                    )
+        session.execute(VACUUM_TABLE.format(full="", table=table), timeout=timeout)
+
+    def _prune_db(self, dbname: str, horizon_days: int, budget):
+        """
+        Удаляет из базы данных записи старше горизонта хранения.
+
+        Очищенные таблицы обрабатываются VACUUM по одной. Ожидание
+        блокировок и время выполнения каждой команды в сессии очистки
+        ограничены на стороне сервера (`prune.lock_timeout`,
+        `prune.vacuum_timeout`).
+
+        :param dbname: Имя базы данных.
+        :type dbname: str
+        :param horizon_days: Горизонт хранения записей в сутках.
+        :type horizon_days: int
+        :param budget: Объём, который осталось освободить.
+        :type budget: _PruneBudget
+        :return: Результат очистки базы.
+        :rtype: ntuple_pruneresult
+        """
+        cfg = PSQL_CFG["prune"]
+        started = time.monotonic()
+        session = PsqlSession(PSQL_CFG["user"], dbname, PSQL_CFG["timeout"])
+        deleted_rows = reusable = 0
+        try:
+            session.execute(
+                SET_TIMEOUTS.format(lock=cfg["lock_timeout"], statement=cfg["vacuum_timeout"])
+            )
+            size_before = session.execute(CURRENT_DB_SIZE, (int,))[0][0]
+            columns = ", ".join(f"'{column}'" for column in cfg["time_columns"])
+            for table, column in session.execute(PRUNE_TABLES.format(columns=columns)):
+                if budget.exhausted:
+                    break
+                table_rows, table_size = self._prune_table(
+                    session, table, column, horizon_days, budget
+                )
+                deleted_rows += table_rows
+                reusable += table_size
+                if table_rows:
+                    self._vacuum_table(session, table, dbname)
+            size_after = session.execute(CURRENT_DB_SIZE, (int,))[0][0]
+            result = ntuple_pruneresult(
+                dbname, deleted_rows, reusable, max(size_before - size_after, 0),
+                time.monotonic() - started, None,
+            )
+            logging.info(
+                f"{self._log_owner}:prune:{dbname}: удалено {deleted_rows} записей, "
+                f"около {result.reusable} байт доступно для повторного использования "
+                f"внутри PostgreSQL, возвращено системе {result.reclaimed} байт "
+                f"за {result.elapsed:.2f} сек."
+            )
+        except PsqlError as err:
+            result = ntuple_pruneresult(
+                dbname, deleted_rows, reusable, 0, time.monotonic() - started, f"{err}"
+            )
+            logging.error(f"{self._log_owner}:prune:{dbname}: {err}")
+        finally:
+            session.close()
+        return result
+
+    def _prunable_size_db(self, dbname: str, horizon_days: int) -> int:
+        cfg = PSQL_CFG["prune"]
+        session = PsqlSession(PSQL_CFG["user"], dbname, PSQL_CFG["timeout"])
+        try:
+            columns = ", ".join(f"'{column}'" for column in cfg["time_columns"])
+            return sum(
+                session.execute(
+                    PRUNE_ESTIMATE.format(table=table, column=column, days=int(horizon_days)),
+                    (int,),
+                )[0][0] or 0
+                for table, column in session.execute(PRUNE_TABLES.format(columns=columns))
+            )
+        except PsqlError as err:
+            logging.error(f"{self._log_owner}:prunable_size:{dbname}: {err}")
+            return 0
+        finally:
+            session.close()
+
+    def prunable_size(self, horizon_days: int = None, dbnames: list = None) -> int:
+        """
+        Оценивает объём устаревших записей, которые удалит `prune`.
+
+        Доля устаревших записей каждой таблицы оценивается по случайной
+        выборке страниц, поэтому оценка приблизительная, но не требует
+        чтения таблиц целиком. Системе этот объём возвращается только
+        при `prune.vacuum_full`, иначе он лишь становится доступным
+        для новых записей внутри PostgreSQL.
+
+        :param horizon_days: Горизонт хранения записей в сутках
+        (по-умолчанию - `prune.horizon_days` конфигурации).
+        :type horizon_days: int
+        :param dbnames: Имена баз данных (по-умолчанию - все управляемые базы).
+        :type dbnames: list
+        :return: Объём в байтах.
+        :rtype: int
+        """
+        if horizon_days is None:
+            horizon_days = PSQL_CFG["prune"]["horizon_days"]
+        dbnames = PSQL_CFG["manage_dbs"] if dbnames is None else dbnames
+        if not dbnames:
+            return 0
+        with Scheduler.thread_pool(min(self._psql.size, len(dbnames))) as executor:
+            return sum(executor.map(
+                lambda name: self._prunable_size_db(name, horizon_days), dbnames
+            ))
+
+    def prune(
+            self,
+            horizon_days: int = None,
+            dbnames: list = None,
+            workers: int = None,
+            needed: int = None,
+        ) -> list:
+        """
+        Удаляет устаревшие записи из управляемых баз данных
+        без остановки среды исполнения.
+
+        Очищаются таблицы, содержащие столбец времени из списка
+        `prune.time_columns` конфигурации, записи удаляются
+        от самых старых.
+
+        :param horizon_days: Горизонт хранения записей в сутках
+        (по-умолчанию - `prune.horizon_days` конфигурации).
+        :type horizon_days: int
+        :param dbnames: Имена баз данных (по-умолчанию - все управляемые базы).
+        :type dbnames: list
+        :param workers: Количество параллельно очищаемых баз
+        (по-умолчанию - размер пула сессий).
+        :type workers: int
+        :param needed: Объём в байтах, после удаления которого очистка
+        прекращается, даже если устаревшие записи остались
+        (по-умолчанию - удаляются все устаревшие записи).
+        :type needed: int
+        :return: Результаты очистки в порядке `dbnames`.
+        :rtype: list[ntuple_pruneresult]
+        """
+        if horizon_days is None:
+            horizon_days = PSQL_CFG["prune"]["horizon_days"]
+        dbnames = PSQL_CFG["manage_dbs"] if dbnames is None else dbnames
+        if not dbnames:
+            return []
+        workers = min(workers or self._psql.size, len(dbnames))
+        budget = _PruneBudget(needed)
+        with Scheduler.thread_pool(workers) as executor:
+            results = list(executor.map(
+                lambda name: self._prune_db(name, horizon_days, budget), dbnames
+            ))
+        logging.info(
+            f"{self._log_owner}:prune: всего около {sum(r.reusable for r in results)} байт "
+            f"доступно внутри PostgreSQL, возвращено системе {sum(r.reclaimed for r in results)} байт"
+        )
+        return results
@@ -1,7 +1,70 @@
+import bz2
+from concurrent.futures import ProcessPoolExecutor
+import gzip
+import json
+import logging
+import lzma
 import os
-from ...config import MPLC4_LOG_PATH
+import shutil
+import stat
+from ...config import (
+    MPLC4_LOG_PATH,
+    MPLC4_LOG_KEEP_TAIL,
+    MPLC4_LOG_COMPRESSION,
+    IGNORED_FILES,
+)
 from ..system import System
 
+# Форматы сжатия: {формат: (функция открытия файла на запись, расширение)}
+_COMPRESSORS = {
+    "gzip": (lambda path, level: gzip.open(path, "wb", compresslevel=level), ".gz"),
+    "xz": (lambda path, level: lzma.open(path, "wb", preset=level), ".xz"),
+    "bz2": (lambda path, level: bz2.open(path, "wb", compresslevel=level), ".bz2"),
+}
+_COMPRESSED_SUFFIXES = tuple(suffix for _, suffix in _COMPRESSORS.values())
+_PARTIAL_SUFFIX = ".part"
+_MANIFEST_NAME = ".compression.json"
+# Доля размера, остающаяся после сжатия, пока нет собственной статистики
+_DEFAULT_COMPRESSION_RATIO = 0.1
+
+
+def _compress_file(path: str, format: str, level: int):
+    """
+    Сжимает файл журнала и удаляет исходный.
+    Выполняется в процессе пула `Journal.compress`.
+
+    :return: Кортеж (имя исходного файла, имя сжатого файла,
+    исходный размер, размер после сжатия) или `None`,
+    если файл изменился во время сжатия.
+    :rtype: tuple
+    """
+    open_compressed, suffix = _COMPRESSORS[format]
+    target = path + suffix
+    partial = target + _PARTIAL_SUFFIX
+    file_stat = os.stat(path)
+    try:
+        with open(path, "rb") as src, open_compressed(partial, level) as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        os.utime(partial, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+        current_stat = os.stat(path)
+        if (current_stat.st_size, current_stat.st_mtime_ns) != (
+            file_stat.st_size, file_stat.st_mtime_ns
+        ):
+            os.remove(partial)
+            return None
+        os.replace(partial, target)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.remove(path)
+    return (
+        os.path.basename(path),
+        os.path.basename(target),
+        file_stat.st_size,
+        os.path.getsize(target),
+    )
+
 
 # TODO Добавить обработку исключений
 class Journal:
@@ -11,23 +74,292 @@ class Journal:
         self._pathdir = MPLC4_LOG_PATH
 
     def _fetch_logfile_names(self):
-        names_list: list = os.listdir(self._pathdir)
-        try:
-            names_list.remove('start_log.txt')
-        finally:
-            return names_list
+        return [
+            name for name in os.listdir(self._pathdir)
+            if name not in IGNORED_FILES
+            and name != _MANIFEST_NAME
+            and not name.endswith(_PARTIAL_SUFFIX)
+        ]
 
     @property
     def size(self):
-        return System.get_dir_size(self._pathdir)
+        # Занятое место, а не сумма размеров: у файлов, обрезанных
+        # `truncate_used`, размер сохраняется, а место освобождено
+        return System.get_dir_size(self._pathdir, allocated=True)
+
+    @property
+    def deletable_size(self) -> int:
+        """
+        Возвращает место, занятое файлами журнала,
+        которые не используются процессами и могут быть удалены.
+
+        :rtype: int
+        """
+        used_files = System.get_used_files()
+        total_size = 0
+        for name in self._fetch_logfile_names():
+            try:
+                file_stat = os.stat(f"{self._pathdir}/{name}")
+            except OSError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode) and (file_stat.st_dev, file_stat.st_ino) not in used_files:
+                total_size += file_stat.st_blocks * 512
+        return total_size
+
+    def _iter_appended_files(self):
+        """
+        Перебирает используемые процессами файлы журнала,
+        которые открыты на запись только в режиме дозаписи (O_APPEND).
+
+        :return: Пары (путь к файлу, os.stat_result).
+        :rtype: Iterator[tuple[str, os.stat_result]]
+        """
+        used_files = System.get_used_files()
+        for name in self._fetch_logfile_names():
+            filepath = f"{self._pathdir}/{name}"
+            try:
+                file_stat = os.stat(filepath)
+            except OSError:
+                continue
+            openers = used_files.get((file_stat.st_dev, file_stat.st_ino))
+            if not openers:
+                continue
+            flags = (System.get_fd_flags(pid, fd) for pid, fd in openers)
+            if any(
+                f is not None
+                and f & os.O_ACCMODE != os.O_RDONLY
+                and not f & os.O_APPEND
+                for f in flags
+            ):
+                logging.info(f"{self._log_owner}: {name}: открыт на запись не в режиме дозаписи, пропуск")
+                continue
+            yield filepath, file_stat
+
+    def truncatable_size(self, keep_tail: int = None) -> int:
+        """
+        Возвращает объём, который освободит `truncate_used`.
+
+        :param keep_tail: Сколько последних байт каждого файла сохранить
+        (по-умолчанию - `mplc4_log_keep_tail` конфигурации).
+        :type keep_tail: int
+        :rtype: int
+        """
+        keep_tail = MPLC4_LOG_KEEP_TAIL if keep_tail is None else keep_tail
+        return sum(
+            max(file_stat.st_blocks * 512 - keep_tail, 0)
+            for _, file_stat in self._iter_appended_files()
+        )
+
+    def truncate_used(self, keep_tail: int = None) -> dict:
+        """
+        Освобождает место, занятое используемыми файлами журнала,
+        без перезапуска mplc4.
+
+        У файлов, открытых на запись в режиме дозаписи, освобождается
+        начало, последние `keep_tail` байт сохраняются.
+
+        :param keep_tail: Сколько последних байт каждого файла сохранить
+        (по-умолчанию - `mplc4_log_keep_tail` конфигурации).
+        :type keep_tail: int
+        :return: Словарь вида {путь к файлу: освобождённый объём в байтах}.
+        :rtype: dict
+        """
+        keep_tail = MPLC4_LOG_KEEP_TAIL if keep_tail is None else keep_tail
+        reclaimed = {}
+        for filepath, _ in self._iter_appended_files():
+            size = System.truncate_head(filepath, keep_tail)
+            if size is not None:
+                reclaimed[filepath] = size
+                logging.info(f"{self._log_owner}: {filepath}: освобождено {size} байт")
+        return reclaimed
+
+    def _load_manifest(self) -> dict:
+        try:
+            with open(f"{self._pathdir}/{_MANIFEST_NAME}", "r") as file:
+                return dict(json.load(file))
+        except FileNotFoundError:
+            return {}
+        except Exception as err:
+            logging.error(f"{self._log_owner}: не удалось прочитать манифест сжатия: {err}")
+            return {}
+
+    def _save_manifest(self, manifest: dict):
+        # Манифест содержит записи только для существующих сжатых файлов
+        names = set(os.listdir(self._pathdir))
+        manifest = {name: entry for name, entry in manifest.items() if name in names}
+        manifest_path = f"{self._pathdir}/{_MANIFEST_NAME}"
+        try:
+            with open(manifest_path + _PARTIAL_SUFFIX, "w") as file:
+                json.dump(manifest, file, indent=4)
+            os.replace(manifest_path + _PARTIAL_SUFFIX, manifest_path)
+        except Exception as err:
+            logging.error(f"{self._log_owner}: не удалось сохранить манифест сжатия: {err}")
+
+    @property
+    def manifest(self) -> dict:
+        """
+        Возвращает манифест сжатых файлов журнала.
+
+        :return: Словарь вида {имя сжатого файла: {"original": имя исходного файла,
+        "size": исходный размер, "compressed": размер после сжатия}}.
+        :rtype: dict
+        """
+        return self._load_manifest()
+
+    def _iter_compressible_files(self):
+        used_files = System.get_used_files()
+        for name in self._fetch_logfile_names():
+            if name.endswith(_COMPRESSED_SUFFIXES):
+                continue
+            filepath = f"{self._pathdir}/{name}"
+            try:
+                file_stat = os.stat(filepath)
+            except OSError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode) and (file_stat.st_dev, file_stat.st_ino) not in used_files:
+                yield filepath, file_stat
+
+    def _iter_compressed_files(self):
+        for name in self._fetch_logfile_names():
+            if not name.endswith(_COMPRESSED_SUFFIXES):
+                continue
+            filepath = f"{self._pathdir}/{name}"
+            try:
+                yield filepath, os.stat(filepath)
+            except OSError:
+                continue
+
+    @property
+    def compressible_size(self) -> int:
+        """
+        Возвращает примерный объём, который освободит `compress`.
+        Степень сжатия оценивается по манифесту уже сжатых файлов.
+
+        :rtype: int
+        """
+        entries = self._load_manifest().values()
+        original = sum(entry["size"] for entry in entries)
+        ratio = (
+            sum(entry["compressed"] for entry in entries) / original
+            if original else _DEFAULT_COMPRESSION_RATIO
+        )
+        return int(sum(
+            file_stat.st_blocks * 512 for _, file_stat in self._iter_compressible_files()
+        ) * (1 - ratio))
+
+    @property
+    def compressed_size(self) -> int:
+        """
+        Возвращает место, занятое сжатыми файлами журнала.
+
+        :rtype: int
+        """
+        return sum(file_stat.st_blocks * 512 for _, file_stat in self._iter_compressed_files())
+
+    def _remove_stale_partials(self):
+        """
+        Удаляет незавершённые файлы сжатия (`*.part`), оставшиеся после
+        аварийного завершения процесса сжатия, если они никем не открыты.
+        """
+        used_files = System.get_used_files()
+        for name in os.listdir(self._pathdir):
+            if not name.endswith(_PARTIAL_SUFFIX):
+                continue
+            filepath = f"{self._pathdir}/{name}"
+            if not System.isusedfile(filepath, used_files):
+                logging.info(f"{self._log_owner}: удаление незавершённого файла {name!r}")
+                System.remove_file(filepath)
+
+    def compress(self, format: str = None, level: int = None, workers: int = None) -> dict:
+        """
+        Сжимает файлы журнала, не используемые процессами,
+        и удаляет исходные файлы.
+
+        Файлы сжимаются параллельно в пуле процессов с минимальными
+        приоритетами CPU и ввода-вывода. Незавершённые файлы сжатия,
+        оставшиеся от прерванного запуска, предварительно удаляются. Исходные размеры сохраняются
+        в манифест `.compression.json` в директории журнала.
+
+        :param format: Формат сжатия: "gzip", "xz" или "bz2"
+        (по-умолчанию - из `mplc4_log_compression` конфигурации).
+        :type format: str
+        :param level: Уровень сжатия.
+        :type level: int
+        :param workers: Количество процессов.
+        :type workers: int
+        :return: Словарь вида {имя исходного файла: (исходный размер, размер после сжатия)}.
+        :rtype: dict
+        """
+        format = format or MPLC4_LOG_COMPRESSION["format"]
+        level = MPLC4_LOG_COMPRESSION["level"] if level is None else level
+        workers = workers or MPLC4_LOG_COMPRESSION["workers"]
+        if format not in _COMPRESSORS:
+            logging.error(f"{self._log_owner}: неизвестный формат сжатия {format!r}")
+            return {}
+        self._remove_stale_partials()
+        filepaths = [filepath for filepath, _ in self._iter_compressible_files()]
+        if not filepaths:
+            return {}
+        manifest = self._load_manifest()
+        compressed = {}
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(filepaths)),
+            initializer=System.set_low_priority,
+        ) as executor:
+            futures = {
+                executor.submit(_compress_file, filepath, format, level): filepath
+                for filepath in filepaths
+            }
+            for future, filepath in futures.items():
+                try:
+                    result = future.result()
+                except Exception as err:
+                    logging.error(f"{self._log_owner}: не удалось сжать {filepath!r}: {err}")
+                    continue
+                if result is None:
+                    logging.info(f"{self._log_owner}: {filepath!r} изменился во время сжатия, пропуск")
+                    continue
+                name, target, size, compressed_size = result
+                manifest[target] = {
+                    "original": name, "size": size, "compressed": compressed_size
+                }
+                compressed[name] = (size, compressed_size)
+        self._save_manifest(manifest)
+        logging.info(
+            f"{self._log_owner}: сжато файлов: {len(compressed)}, освобождено "
+            f"{sum(size - compressed_size for size, compressed_size in compressed.values())} байт"
+        )
+        return compressed
+
+    def clear_compressed(self, needed: int = None) -> int:
+        """
+        Удаляет сжатые файлы журнала, начиная с самых старых.
+
+        :param needed: Объём в байтах, после освобождения которого
+        удаление прекращается (по-умолчанию - удаляются все).
+        :type needed: int
+        :return: Освобождённый объём в байтах.
+        :rtype: int
+        """
+        freed = 0
+        for filepath, file_stat in sorted(
+            self._iter_compressed_files(), key=lambda item: item[1].st_mtime
+        ):
+            if needed is not None and freed >= needed:
+                break
+            if System.remove_file(filepath):
+                freed += file_stat.st_blocks * 512
+        self._save_manifest(self._load_manifest())
+        return freed
 
     def clear(self, all: bool = False):
         # TODO Добавить логику для настраиваемой очистки
         filepaths_list = (
             f"{self._pathdir}/{name}" for name in self._fetch_logfile_names()
         )
+        used_files = System.get_used_files() if not all else None
         for filepath in filepaths_list:
             if not all:
-                if System.isusedfile(filepath):
+                if System.isusedfile(filepath, used_files):
                     continue
             System.remove_file(filepath)
@@ -1,4 +1,5 @@
 import logging
+import os
 from .current_project import CurrentProject
 from .journal import Journal
 from .archive import Archive
@@ -16,13 +17,9 @@ class MPLC4:
         return cls._instance
 
     def __init__(self):
-        try:
-            if System.get_dir_size(MPLC4_PATH) is None:
-                raise FileNotFoundError("расположение mplc4 не обнаружено ")
-            elif System._run_quiet(["psql", "--version"]):
-                raise SystemError("в системе не обнаружено psql")
-        except Exception as err:
-            logging.critical(f"{self.__class__.__name__}: {err}")
+        System.preflight("psql")
+        if not os.path.isdir(MPLC4_PATH):
+            logging.critical(f"{self.__class__.__name__}: расположение mplc4 не обнаружено")
             System.exit(1)
 
         self._service = System.get_service("mplc4.service")
@@ -0,0 +1,299 @@
+import contextlib
+import logging
+import math
+import os
+import queue
+import re
+import select
+import subprocess as sp
+import threading
+import time
+
+from ..scheduler import Scheduler
+
+
+class PsqlError(Exception):
+    """Исключение, вызываемое при ошибке выполнения SQL-команды."""
+    pass
+
+
+class _PsqlConnectionError(PsqlError):
+    """Исключение, вызываемое при потере соединения с процессом `psql`."""
+    pass
+
+
+class _PsqlSendError(_PsqlConnectionError):
+    """
+    Исключение, вызываемое, если процесс `psql` завершился
+    при подключении или до передачи команды.
+    """
+    pass
+
+
+class PsqlSession:
+    """
+    Долгоживущая сессия PostgreSQL поверх одного процесса `psql`.
+
+    Процесс подключается через локальный Unix-сокет и принимает команды
+    через stdin, поэтому sudo, запуск процесса и аутентификация
+    выполняются один раз на сессию, а не на каждый запрос.
+    При обрыве соединения сессия переподключается автоматически;
+    команда отправляется повторно, только если сервер её не получил.
+
+    :param user: Пользователь PostgreSQL.
+    :type user: str
+    :param dbname: База данных для подключения (по-умолчанию - база пользователя).
+    :type dbname: str
+    :param timeout: Максимальное время выполнения команды (в секундах).
+    :type timeout: int
+    """
+
+    _SEP = "\x1f"
+    _ERROR_RE = re.compile(r"(?:ERROR|FATAL):.*")
+    _NULL = "\x1e"
+    _MARKER = "--psql-session-done-{}--"
+
+    def __init__(self, user: str, dbname: str = None, timeout: int = 60):
+        self._user = user
+        self._dbname = dbname
+        self._timeout = timeout
+        self._proc = None
+        self._buffer = b""
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._log_owner = f"{self.__class__.__name__}:{dbname or user}"
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(user={self._user!r}, dbname={self._dbname!r})"
+
+    @property
+    def connected(self) -> bool:
+        """
+        Проверяет, запущен ли процесс `psql` сессии.
+
+        :return: `True`, если процесс запущен, иначе `False`.
+        :rtype: bool
+        """
+        return self._proc is not None and self._proc.poll() is None
+
+    def _connect(self):
+        """
+        Запускает процесс `psql` и настраивает вывод сессии.
+
+        :raises PsqlError: Если подключиться к серверу не удалось.
+        """
+        # stdbuf переводит stdout psql в построчный режим,
+        # иначе вывод в канал буферизуется и маркер не будет прочитан
+        args = [
+            "sudo", "stdbuf", "-oL", "psql", "-U", self._user,
+            "-X", "-q", "-A", "-t",
+            "-F", self._SEP,
+            "-P", f"null={self._NULL}",
+            "-P", "pager=off",
+            "-v", "ON_ERROR_STOP=0",
+        ]
+        if self._dbname:
+            args += ["-d", self._dbname]
+        self._buffer = b""
+        self._proc = sp.Popen(
+            args,
+            stdin = sp.PIPE,
+            stdout = sp.PIPE,
+            stderr = sp.STDOUT,
+            bufsize = 0,
+        )
+        try:
+            self._execute("SET client_min_messages TO warning")
+        except _PsqlConnectionError as err:
+            raise _PsqlSendError(f"{err}")
+        logging.info(f"{self._log_owner}: сессия открыта")
+
+    def close(self):
+        """Завершает процесс `psql` сессии."""
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        proc, self._proc = self._proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=5)
+        except Exception:
+            proc.kill()
+            proc.wait()
+
+    def _readline(self, deadline: float) -> str:
+        """
+        Читает одну строку вывода `psql` с учётом времени ожидания.
+
+        :param deadline: Момент времени (`time.monotonic`), после
+        которого ожидание прерывается.
+        :raises PsqlError: При истечении времени ожидания
+        или завершении процесса.
+        """
+        fd = self._proc.stdout.fileno()
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._close()
+                raise PsqlError("исчерпан лимит ожидания")
+            ready, _, _ = select.select(
+                [fd], [], [], None if remaining == math.inf else remaining
+            )
+            if not ready:
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                output = self._buffer.decode(errors="replace").strip()
+                raise _PsqlConnectionError(f"процесс psql завершился: {output}")
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode(errors="replace")
+
+    def _execute(self, cmd: str, timeout: float = None) -> list:
+        """
+        Отправляет команду в процесс `psql` и читает её вывод
+        до маркера завершения.
+
+        :return: Список строк вывода.
+        :raises PsqlError: Если сервер вернул ошибку.
+        """
+        self._counter += 1
+        marker = self._MARKER.format(self._counter)
+        payload = cmd.rstrip().rstrip(";") + ";\n" + f"\\echo {marker}\n"
+        # Процесс сессии на время команды считается процессом текущей
+        # работы планировщика: сторож завершит его при превышении времени
+        with Scheduler.track(self._proc.pid):
+            try:
+                self._proc.stdin.write(payload.encode())
+            except OSError as err:
+                raise _PsqlSendError(f"процесс psql недоступен: {err}")
+            deadline = time.monotonic() + (self._timeout if timeout is None else timeout)
+            lines, errors = [], []
+            while True:
+                line = self._readline(deadline)
+                if line == marker:
+                    break
+                if line.startswith(("psql:", "ERROR:", "FATAL:")):
+                    # Сообщения сервера, уровни ниже ERROR пропускаются
+                    error = self._ERROR_RE.search(line)
+                    if error:
+                        errors.append(error.group())
+                    continue
+                lines.append(line)
+        if errors:
+            raise PsqlError("; ".join(errors))
+        return lines
+
+    def execute(self, cmd: str, types: tuple = None, timeout: float = None) -> list:
+        """
+        Выполняет SQL-команду и возвращает строки результата.
+
+        :param cmd: SQL-команда.
+        :type cmd: str
+        :param types: Функции приведения типов для столбцов результата.
+        Если не переданы, значения возвращаются строками.
+        :type types: tuple
+        :param timeout: Максимальное время выполнения команды в секундах
+        (по-умолчанию - время сессии, `math.inf` - без ограничения).
+        :type timeout: float
+        :return: Список кортежей со значениями столбцов, NULL
+        возвращается как `None`.
+        :rtype: list[tuple]
+        :raises PsqlError: Если выполнить команду не удалось.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if not self.connected:
+                        self._connect()
+                    lines = self._execute(cmd, timeout)
+                    break
+                except _PsqlSendError as err:
+                    # Ошибка подключения или передачи команды:
+                    # сервер её не получил, повтор безопасен
+                    self._close()
+                    if attempt == 2:
+                        raise PsqlError(f"{err}")
+                    logging.warning(f"{self._log_owner}: переподключение: {err}")
+                except _PsqlConnectionError as err:
+                    # Команда могла быть выполнена (или процесс завершён
+                    # сторожем по таймауту), поэтому повторно не отправляется
+                    self._close()
+                    raise PsqlError(f"{err}")
+        rows = []
+        for line in lines:
+            values = [None if v == self._NULL else v for v in line.split(self._SEP)]
+            if types:
+                values = [
+                    v if v is None or cast is None else cast(v)
+                    for cast, v in zip(types, values)
+                ]
+            rows.append(tuple(values))
+        return rows
+
+
+class PsqlPool:
+    """
+    Пул сессий `PsqlSession` для параллельного выполнения команд.
+
+    Сессии подключаются лениво, при первом использовании,
+    и переиспользуются в порядке LIFO, чтобы по возможности
+    обходиться уже открытыми подключениями.
+
+    :param user: Пользователь PostgreSQL.
+    :type user: str
+    :param size: Количество сессий в пуле.
+    :type size: int
+    :param dbname: База данных для подключения.
+    :type dbname: str
+    :param timeout: Максимальное время выполнения команды (в секундах).
+    :type timeout: int
+    """
+
+    def __init__(self, user: str, size: int = 1, dbname: str = None, timeout: int = 60):
+        self._size = max(1, size)
+        self._sessions = queue.LifoQueue()
+        for _ in range(self._size):
+            self._sessions.put(PsqlSession(user, dbname, timeout))
+
+    @property
+    def size(self) -> int:
+        """
+        Возвращает количество сессий в пуле.
+
+        :rtype: int
+        """
+        return self._size
+
+    @contextlib.contextmanager
+    def session(self):
+        """
+        Контекстный менеджер, выдающий свободную сессию пула.
+
+        :return: Сессия, возвращаемая в пул при выходе из контекста.
+        :rtype: PsqlSession
+        """
+        session = self._sessions.get()
+        try:
+            yield session
+        finally:
+            self._sessions.put(session)
+
+    def execute(self, cmd: str, types: tuple = None, timeout: float = None) -> list:
+        """
+        Выполняет SQL-команду в свободной сессии пула.
+
+        Параметры и результат совпадают с `PsqlSession.execute`.
+        """
+        with self.session() as session:
+            return session.execute(cmd, types, timeout)
+
+    def close(self):
+        """Завершает все сессии пула."""
+        sessions = [self._sessions.get() for _ in range(self._size)]
+        for session in sessions:
+            session.close()
+            self._sessions.put(session)
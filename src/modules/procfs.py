@@ -0,0 +1,71 @@
+import os
+import re
+import threading
+
+
+class ProcFile:
+    """
+    Файл procfs, открытый на всё время работы процесса.
+
+    Содержимое перечитывается одним `pread` с нулевого смещения
+    в переиспользуемый буфер, без повторного открытия файла
+    и выделения памяти под текст. Буфер увеличивается,
+    если содержимое в него не поместилось. Если чтение не удалось
+    (например, файл cgroup пересоздан при перезапуске службы),
+    файл один раз открывается заново.
+
+    :param path: Путь к файлу, например `/proc/meminfo`.
+    :type path: str
+    :param size: Начальный размер буфера в байтах.
+    :type size: int
+    """
+
+    def __init__(self, path: str, size: int = 4096):
+        self._path = path
+        self._fd = None
+        self._buffer = bytearray(size)
+        self._lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        return self._path
+
+    def _read(self) -> int:
+        if self._fd is None:
+            self._fd = os.open(self._path, os.O_RDONLY | os.O_CLOEXEC)
+        while True:
+            length = os.preadv(self._fd, (self._buffer,), 0)
+            if length < len(self._buffer):
+                return length
+            self._buffer = bytearray(len(self._buffer) * 2)
+
+    def findall(self, pattern: re.Pattern) -> list:
+        """
+        Перечитывает файл и возвращает группы всех совпадений
+        байтового регулярного выражения.
+
+        :param pattern: Скомпилированное регулярное выражение над `bytes`.
+        :type pattern: re.Pattern
+        :return: Список кортежей групп, как у `re.Pattern.findall`.
+        :rtype: list
+        :raises OSError: Если файл не удалось прочитать.
+        """
+        with self._lock:
+            try:
+                length = self._read()
+            except OSError:
+                if self._fd is None:
+                    raise
+                self._close()
+                length = self._read()
+            return pattern.findall(self._buffer, 0, length)
+
+    def _close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def close(self):
+        """Закрывает файловый дескриптор."""
+        with self._lock:
+            self._close()
@@ -0,0 +1,166 @@
+from collections import namedtuple
+import fnmatch
+import heapq
+import logging
+import os
+import stat
+import time
+
+from .system import System
+from ..config import IGNORED_FILES
+
+ntuple_retentionrule = namedtuple(
+    "RetentionRule", "path pattern max_age max_total_size keep_newest exclude"
+)
+ntuple_retentionfile = namedtuple("RetentionFile", "mtime path size")
+
+
+class Retention:
+    """
+    Удаление файлов по правилам хранения.
+
+    Правило задаётся для одной директории (без поддиректорий) и отбирает
+    файлы по шаблону имени. Удаляются файлы старше `max_age` секунд,
+    затем самые старые из оставшихся, пока их суммарный размер
+    больше `max_total_size` байт. `keep_newest` самых новых файлов
+    не удаляются никогда, так же как файлы, подходящие под шаблоны
+    `exclude`, файлы из `IGNORED_FILES` и файлы, открытые процессами.
+
+    Каждая директория читается за один проход `os.scandir`,
+    кандидаты на удаление упорядочиваются по возрасту через кучу.
+
+    :param rules: Правила хранения - словари с ключами `path`, `pattern`,
+    `max_age`, `max_total_size`, `keep_newest`, `exclude`
+    (все, кроме `path`, необязательны).
+    :type rules: Iterable[dict]
+    """
+
+    def __init__(self, rules):
+        self._log_owner = self.__class__.__name__
+        self._rules = tuple(self._make_rule(rule) for rule in rules)
+
+    @staticmethod
+    def _make_rule(rule: dict):
+        return ntuple_retentionrule(
+            rule["path"],
+            rule.get("pattern", "*"),
+            rule.get("max_age"),
+            rule.get("max_total_size"),
+            rule.get("keep_newest", 0),
+            tuple(rule.get("exclude", ())) + tuple(IGNORED_FILES),
+        )
+
+    @property
+    def rules(self) -> tuple:
+        """
+        Возвращает правила хранения.
+
+        :rtype: tuple[ntuple_retentionrule]
+        """
+        return self._rules
+
+    def _scan(self, rule) -> list:
+        """Читает директорию правила и возвращает подходящие файлы."""
+        files = []
+        try:
+            with os.scandir(rule.path) as entries:
+                for entry in entries:
+                    if not fnmatch.fnmatch(entry.name, rule.pattern):
+                        continue
+                    if any(fnmatch.fnmatch(entry.name, exclude) for exclude in rule.exclude):
+                        continue
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISREG(entry_stat.st_mode):
+                        files.append(ntuple_retentionfile(
+                            entry_stat.st_mtime, entry.path, entry_stat.st_blocks * 512
+                        ))
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logging.error(f"{self._log_owner}: не удалось прочитать {rule.path!r}: {err}")
+        return files
+
+    def evaluate(self, rule, used_files: dict = None, now: float = None) -> list:
+        """
+        Возвращает файлы, подлежащие удалению по правилу.
+
+        :param rule: Правило хранения.
+        :type rule: ntuple_retentionrule
+        :param used_files: Индекс открытых файлов из `System.get_used_files`.
+        Если не передан, строится заново.
+        :type used_files: dict
+        :param now: Текущее время (`time.time`).
+        :type now: float
+        :return: Файлы в порядке от самого старого.
+        :rtype: list[ntuple_retentionfile]
+        """
+        used_files = System.get_used_files() if used_files is None else used_files
+        now = time.time() if now is None else now
+        files = self._scan(rule)
+        if rule.keep_newest:
+            kept = heapq.nlargest(rule.keep_newest, files)
+            total_size = sum(file.size for file in kept)
+            kept = set(kept)
+            heap = [file for file in files if file not in kept]
+        else:
+            total_size = 0
+            heap = files
+        heapq.heapify(heap)
+        total_size += sum(file.size for file in heap)
+        expired = now - rule.max_age if rule.max_age is not None else None
+        candidates = []
+        while heap:
+            oldest = heap[0]
+            too_old = expired is not None and oldest.mtime < expired
+            too_big = rule.max_total_size is not None and total_size > rule.max_total_size
+            if not too_old and not too_big:
+                break
+            heapq.heappop(heap)
+            if self._is_used(oldest.path, used_files):
+                continue
+            candidates.append(oldest)
+            total_size -= oldest.size
+        return candidates
+
+    @staticmethod
+    def _is_used(path: str, used_files: dict) -> bool:
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return True
+        return (file_stat.st_dev, file_stat.st_ino) in used_files
+
+    @property
+    def reclaimable_size(self) -> int:
+        """
+        Возвращает объём в байтах, который освободит `apply`.
+
+        :rtype: int
+        """
+        used_files = System.get_used_files()
+        return sum(
+            file.size for rule in self._rules for file in self.evaluate(rule, used_files)
+        )
+
+    def apply(self) -> dict:
+        """
+        Удаляет файлы по всем правилам хранения.
+
+        :return: Словарь вида {путь к файлу: освобождённый объём в байтах}.
+        :rtype: dict
+        """
+        used_files = System.get_used_files()
+        removed = {}
+        for rule in self._rules:
+            for file in self.evaluate(rule, used_files):
+                if System.remove_file(file.path):
+                    removed[file.path] = file.size
+        if removed:
+            logging.info(
+                f"{self._log_owner}: удалено файлов: {len(removed)}, "
+                f"освобождено {sum(removed.values())} байт"
+            )
+        return removed
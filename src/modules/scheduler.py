@@ -1,33 +1,423 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import contextlib
+import heapq
+import itertools
 import logging
-from sys import exit
-from time import sleep
+import os
+import queue
+import random
+import signal
+import subprocess as sp
+import threading
+from time import monotonic
+
+ntuple_jobstats = namedtuple(
+    "JobStats", "runs failures timeouts running last_duration avg_duration max_duration"
+)
+
+
+class _Job:
+    """
+    Запланированная работа планировщика.
+
+    Сроки запуска отсчитываются от сетки `base + N * period`,
+    поэтому время выполнения работы не смещает её расписание.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            func,
+            period: float = None,
+            jitter: float = 0.0,
+            timeout: float = None,
+        ):
+        self.name = name
+        self.func = func
+        self.period = period
+        self.jitter = jitter
+        self.timeout = timeout
+        self.base = None
+        self.timer_id = None
+        self.failures = 0
+        # Состояние текущего запуска
+        self.started = None
+        self.timed_out = False
+        # PID процессов, запущенных текущим запуском работы
+        self.children = set()
+        self.children_lock = threading.Lock()
+        # Статистика запусков
+        self.runs = 0
+        self.total_failures = 0
+        self.timeouts = 0
+        self.last_duration = None
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self.started is not None
+
+    def next_deadline(self, now: float) -> float:
+        """
+        Возвращает следующий срок запуска по сетке расписания
+        с учётом разброса `jitter`. Пропущенные сроки не навёрстываются.
+
+        :param now: Текущее время (`time.monotonic`).
+        :type now: float
+        """
+        if self.base is None:
+            self.base = now
+        else:
+            missed = int((now - self.base) // self.period) if now > self.base else 0
+            self.base += self.period * (missed + 1)
+        return self.base + random.uniform(0, self.jitter)
+
+    def retry_deadline(self, now: float, retry_delay: float) -> float:
+        """
+        Возвращает срок повторного запуска после ошибки.
+
+        Задержка удваивается с каждой ошибкой подряд,
+        но не превышает период работы.
+        """
+        delay = min(retry_delay * 2 ** (self.failures - 1), self.period)
+        return now + delay
+
+    def stats(self) -> ntuple_jobstats:
+        return ntuple_jobstats(
+            self.runs,
+            self.total_failures,
+            self.timeouts,
+            self.running,
+            self.last_duration,
+            self.total_duration / self.runs if self.runs else None,
+            self.max_duration,
+        )
 
 
 class Scheduler:
 
     _logs_owner: str = __qualname__
     _jobs = []
+    _RETRY_DELAY = 5.0
+    _MAX_WORKERS = 4
+    _local = threading.local()
+    _finished = queue.Queue()
+    _triggered = queue.Queue()
+    _wakeup = threading.Event()
 
     @classmethod
-    def job(cls, func) -> None:
-        func_name: str = func.__name__
+    def job(
+            cls,
+            func = None,
+            *,
+            period: float = None,
+            jitter: float = 0.0,
+            timeout: float = None,
+        ):
+        """
+        Регистрирует работу. Используется как декоратор
+        `@Scheduler.job` или `@Scheduler.job(period=..., jitter=..., timeout=...)`.
+
+        :param period: Период запуска в секундах
+        (по-умолчанию - интервал, переданный в `run`).
+        :type period: float
+        :param jitter: Максимальная случайная задержка запуска в секундах.
+        :type jitter: float
+        :param timeout: Максимальное время выполнения в секундах, после
+        которого сторож завершает запущенные работой процессы.
+        :type timeout: float
+        """
+        def register(func):
+            func_name: str = func.__name__
+            cls._jobs.append(_Job(func_name, func, period, jitter, timeout))
+            logging.info(f'{cls._logs_owner}:{func_name}: работа запланирована')
+            return func
 
-        cls._jobs.append((func_name, func))
-        logging.info(f'{cls._logs_owner}:{func_name}: работа запланирована')
+        if func is not None:
+            return register(func)
+        return register
 
     @classmethod
-    def run(cls, interval: int) -> None:
-        while True:
-            for job_name, job in cls._jobs:
-                logging.info(f'{cls._logs_owner}:{job_name}: запуск')
+    def trigger(cls, name: str) -> None:
+        """
+        Запрашивает внеочередной запуск работы. Потокобезопасен.
+
+        Если работа уже выполняется, запрос игнорируется.
+        Расписание работы после запуска не смещается.
+
+        :param name: Имя работы (имя функции).
+        :type name: str
+        """
+        cls._triggered.put(name)
+        cls._wakeup.set()
+
+    @classmethod
+    def set_period(cls, name: str, period: float) -> None:
+        """
+        Изменяет период работы.
+
+        Новый период применяется при планировании следующего запуска,
+        поэтому работа может менять свой период во время выполнения.
+
+        :param name: Имя работы (имя функции).
+        :type name: str
+        :param period: Новый период запуска в секундах.
+        :type period: float
+        """
+        for job in cls._jobs:
+            if job.name == name:
+                job.period = period
+
+    @classmethod
+    def stats(cls) -> dict:
+        """
+        Возвращает статистику запусков работ.
+
+        :return: Словарь вида {имя работы: ntuple_jobstats},
+        длительности - в секундах.
+        :rtype: dict
+        """
+        return {job.name: job.stats() for job in cls._jobs}
+
+    @classmethod
+    def _bind(cls, job: _Job) -> None:
+        """Связывает текущий поток с работой."""
+        cls._local.job = job
+
+    @classmethod
+    def thread_pool(cls, max_workers: int) -> ThreadPoolExecutor:
+        """
+        Создаёт пул потоков, процессы которых учитываются
+        как процессы текущей работы.
 
+        :param max_workers: Количество потоков пула.
+        :type max_workers: int
+        :rtype: ThreadPoolExecutor
+        """
+        return ThreadPoolExecutor(
+            max_workers = max_workers,
+            initializer = cls._bind,
+            initargs = (getattr(cls._local, "job", None),),
+        )
+
+    @classmethod
+    @contextlib.contextmanager
+    def track(cls, pid: int):
+        """
+        Контекстный менеджер, регистрирующий процесс как дочерний
+        процесс текущей работы на время блока. При превышении времени
+        выполнения сторож завершает такой процесс и его потомков.
+        Вне работы ничего не делает.
+
+        :param pid: PID процесса.
+        :type pid: int
+        """
+        job = getattr(cls._local, "job", None)
+        if job is None:
+            yield
+            return
+        with job.children_lock:
+            job.children.add(pid)
+        try:
+            yield
+        finally:
+            with job.children_lock:
+                job.children.discard(pid)
+
+    @classmethod
+    def run_process(cls, args, *, input=None, timeout: float = None, check: bool = False, **kwargs):
+        """
+        Аналог `subprocess.run`, регистрирующий процесс
+        как дочерний процесс текущей работы (см. `track`).
+
+        :rtype: subprocess.CompletedProcess
+        :raises subprocess.CalledProcessError: Если `check`
+        и код возврата ненулевой.
+        :raises subprocess.TimeoutExpired: При истечении `timeout`.
+        """
+        if input is not None:
+            kwargs["stdin"] = sp.PIPE
+        with sp.Popen(args, **kwargs) as proc, cls.track(proc.pid):
+            try:
+                stdout, stderr = proc.communicate(input, timeout=timeout)
+            except BaseException:
+                proc.kill()
+                proc.wait()
+                raise
+        if check and proc.returncode:
+            raise sp.CalledProcessError(proc.returncode, args, stdout, stderr)
+        return sp.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+    @classmethod
+    def _kill_children(cls, job: _Job) -> list:
+        """
+        Завершает процессы, зарегистрированные работой, и их потомков.
+
+        :param job: Работа.
+        :type job: _Job
+        :return: PID завершённых процессов.
+        :rtype: list[int]
+        """
+        with job.children_lock:
+            pending = list(job.children)
+        if not pending:
+            return []
+        parents = {}
+        with os.scandir("/proc") as procs:
+            for proc in procs:
+                if not proc.name.isdigit():
+                    continue
                 try:
-                    job()
-                    logging.info(f'{cls._logs_owner}:{job_name}: завершение')
+                    with open(f"{proc.path}/stat", "r") as file:
+                        fields = file.read().rsplit(")", 1)[1].split()
+                except OSError:
+                    continue
+                parents.setdefault(int(fields[1]), []).append(int(proc.name))
+        # Потомки собираются до завершения процессов:
+        # после завершения родителя они переходят к init
+        tree = []
+        while pending:
+            pid = pending.pop()
+            tree.append(pid)
+            pending.extend(parents.get(pid, ()))
+        killed = []
+        for pid in tree:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                killed.append(pid)
+            except OSError:
+                continue
+        return killed
+
+    @classmethod
+    def _run_job(cls, job: _Job) -> None:
+        """Выполняет работу в потоке пула и сообщает о завершении."""
+        logging.info(f'{cls._logs_owner}:{job.name}: запуск')
+        cls._bind(job)
+        error = None
+        try:
+            job.func()
+        except BaseException as err:
+            error = err
+        finally:
+            cls._bind(None)
+        cls._finished.put((job, error, monotonic() - job.started))
+        cls._wakeup.set()
+
+    @classmethod
+    def _complete_job(cls, job: _Job, error, duration: float) -> float:
+        """
+        Обновляет статистику завершившейся работы.
+
+        :return: Следующий срок запуска работы.
+        :rtype: float
+        """
+        job.started = None
+        job.runs += 1
+        job.last_duration = duration
+        job.total_duration += duration
+        job.max_duration = max(job.max_duration, duration)
+        if isinstance(error, Exception):
+            job.failures += 1
+            job.total_failures += 1
+            logging.error(
+                f'{cls._logs_owner}:{job.name}: ошибка запуска ({job.failures} подряд) - {error}'
+            )
+            return job.retry_deadline(monotonic(), cls._RETRY_DELAY)
+        elif error is not None:
+            # SystemExit и прочие исключения, завершающие демон
+            raise error
+        job.failures = 0
+        logging.info(f'{cls._logs_owner}:{job.name}: завершение за {duration:.2f} сек.')
+        return job.next_deadline(monotonic())
+
+    @classmethod
+    def _watchdog(cls, now: float) -> None:
+        """Завершает процессы работ, превысивших время выполнения."""
+        for job in cls._jobs:
+            if not job.running or job.timed_out or job.timeout is None:
+                continue
+            if now - job.started < job.timeout:
+                continue
+            job.timed_out = True
+            job.timeouts += 1
+            killed = cls._kill_children(job)
+            logging.error(
+                f'{cls._logs_owner}:{job.name}: превышено время выполнения '
+                f'({job.timeout} сек.), завершены процессы: {killed}'
+            )
+
+    @classmethod
+    def run(cls, interval: int) -> None:
+        """
+        Запускает работы по их срокам из кучи таймеров
+        в пуле из `_MAX_WORKERS` потоков.
+
+        Работа не запускается повторно, пока не завершился её предыдущий запуск.
+
+        :param interval: Период работ, для которых он не задан явно.
+        :type interval: int
+        """
+        counter = itertools.count()
+        timers = []
+        jobs = {job.name: job for job in cls._jobs}
+
+        def schedule(job: _Job, deadline: float):
+            # Прежние таймеры работы становятся недействительными
+            job.timer_id = next(counter)
+            heapq.heappush(timers, (deadline, job.timer_id, job))
+
+        now = monotonic()
+        for job in cls._jobs:
+            if job.period is None:
+                job.period = interval
+            schedule(job, job.next_deadline(now))
+
+        executor = ThreadPoolExecutor(
+            max_workers=cls._MAX_WORKERS, thread_name_prefix="job"
+        )
+        try:
+            while True:
+                while not cls._finished.empty():
+                    job, error, duration = cls._finished.get()
+                    schedule(job, cls._complete_job(job, error, duration))
+
+                while not cls._triggered.empty():
+                    job = jobs.get(cls._triggered.get())
+                    if job is None or job.running:
+                        continue
+                    logging.info(f'{cls._logs_owner}:{job.name}: внеочередной запуск')
+                    schedule(job, monotonic())
 
-                except Exception as error:
-                    logging.error(f'{cls._logs_owner}:{job_name}: ошибка запуска - {error}')
-                    exit(1)
+                now = monotonic()
+                cls._watchdog(now)
+                while timers and timers[0][0] <= now:
+                    _, timer_id, job = heapq.heappop(timers)
+                    if timer_id != job.timer_id:
+                        continue
+                    job.started = monotonic()
+                    job.timed_out = False
+                    executor.submit(cls._run_job, job)
 
-            logging.info(f'{cls._logs_owner}: ожидание..')
-            sleep(interval)
+                wakeups = [timers[0][0]] if timers else []
+                wakeups += [
+                    job.started + job.timeout for job in cls._jobs
+                    if job.running and not job.timed_out and job.timeout is not None
+                ]
+                delay = min(wakeups) - monotonic() if wakeups else None
+                if delay is None or delay > 0:
+                    cls._wakeup.wait(delay)
+                cls._wakeup.clear()
+        except BaseException as err:
+            hung = [job.name for job in cls._jobs if job.running]
+            if hung:
+                # Зависшие потоки не дадут интерпретатору завершиться
+                logging.critical(f'{cls._logs_owner}: завершение с незавершёнными работами: {hung}')
+                logging.shutdown()
+                code = err.code if isinstance(err, SystemExit) else 1
+                os._exit(code if isinstance(code, int) else 1)
+            raise
+        finally:
+            executor.shutdown(wait=False)
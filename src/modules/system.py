@@ -3,14 +3,55 @@ import os
 import subprocess as sp
 import sys
 import collections
+import ctypes
+import ctypes.util
+import json
 import platform
+import re
 import shutil
+import stat
+import threading
 import time
 
-from .system_service import SystemService
+from .procfs import ProcFile
+from .scheduler import Scheduler
+from .system_service import SystemService, ntuple_servicestatus
 from ..config import SYS_LOG_PATH
 
 ntuple_memusage = collections.namedtuple("MemUsage", "total used free")
+ntuple_meminfo = collections.namedtuple(
+    "MemInfo",
+    "total free available buffers cached shmem sreclaimable swap_total swap_free",
+)
+# Поля /proc/meminfo в порядке полей ntuple_meminfo
+_MEMINFO_FIELDS = {
+    b"MemTotal": 0,
+    b"MemFree": 1,
+    b"MemAvailable": 2,
+    b"Buffers": 3,
+    b"Cached": 4,
+    b"Shmem": 5,
+    b"SReclaimable": 6,
+    b"SwapTotal": 7,
+    b"SwapFree": 8,
+}
+_MEMINFO_RE = re.compile(
+    rb"^(" + b"|".join(_MEMINFO_FIELDS) + rb"):\s+(\d+)", re.MULTILINE
+)
+_CPU_TIMES_RE = re.compile(rb"^(cpu\d*)" + rb" +(\d+)" * 8, re.MULTILINE)
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_IDLE = 3
+IOPRIO_CLASS_SHIFT = 13
+# Номера системного вызова ioprio_set по архитектурам
+_IOPRIO_SET_SYSCALLS = {"x86_64": 251, "i686": 289, "aarch64": 30, "armv7l": 314}
+ntuple_cpuusage = collections.namedtuple(
+    "CpuUsage", "total user system iowait steal idle"
+)
+ntuple_deletedfile = collections.namedtuple(
+    "DeletedFile", "pid comm fd path inode size"
+)
 
 
 class NotAFileError(Exception):
@@ -37,6 +78,29 @@ class System:
 
     exit = lambda status: sys.exit(status)
 
+    # Последний снимок счётчиков CPU и загрузка, вычисленная по нему
+    _cpu_times = None
+    _cpu_stats = None
+    _cpu_lock = threading.Lock()
+
+    # Загруженная libc для вызовов, отсутствующих в модуле os
+    _libc_handle = None
+    _fallocate = None
+
+    # Открытые файлы procfs: {путь: ProcFile}
+    _proc_files = {}
+
+    # Созданные объекты служб: {имя службы: SystemService}
+    _services = {}
+
+    # Кэш пройденных проверок окружения, действителен до перезагрузки
+    _PREFLIGHT_CACHE = "/run/arm-cleaner/preflight.json"
+    _preflight_passed = set()
+
+    # Индекс содержимого директорий для get_dir_size:
+    # {путь: (st_mtime_ns, занято самой директорией, файлы, поддиректории)}
+    _dir_index = {}
+
     def _run_quiet(args: list) -> int:
         """
         Внутренний метод для выполнения команды без вывода в консоль.
@@ -46,42 +110,170 @@ class System:
         :return: Код возврата команды.
         :rtype: int
         """
-        return sp.run(
+        return Scheduler.run_process(
             args,
             stdout = sp.DEVNULL,
             stderr = sp.DEVNULL,
         ).returncode
 
-    try:
-        if platform.system() != "Linux":
-            raise SystemError("Система не соответствует требованиям")
-        elif os.geteuid():
-            raise PermissionError("Недостаточно прав для запуска")
-        elif _run_quiet(["systemctl", "--version"]):
-            raise SystemError("В системе не обнаружено systemd")
-        elif _run_quiet(["lsof", "-h"]):
-            raise SystemError("В системе не обнаружено lsof")
-    except Exception as err:
-        # logging.critical(f"{__qualname__}: {err}")
-        print(err)
-        exit(1)
+    @classmethod
+    def _get_boot_id(cls) -> str:
+        try:
+            with open("/proc/sys/kernel/random/boot_id", "r") as file:
+                return file.read().strip()
+        except OSError:
+            return None
+
+    @classmethod
+    def _load_preflight_cache(cls, boot_id: str) -> set:
+        try:
+            with open(cls._PREFLIGHT_CACHE, "r") as file:
+                cache = json.load(file)
+            if cache["boot_id"] == boot_id:
+                return set(cache["passed"])
+        except Exception:
+            pass
+        return set()
+
+    @classmethod
+    def _save_preflight_cache(cls, boot_id: str, passed: set):
+        try:
+            os.makedirs(os.path.dirname(cls._PREFLIGHT_CACHE), exist_ok=True)
+            with open(cls._PREFLIGHT_CACHE, "w") as file:
+                json.dump({"boot_id": boot_id, "passed": sorted(passed)}, file)
+        except OSError as err:
+            logging.warning(f"{cls.__name__}:preflight: не удалось сохранить результаты проверок: {err}")
+
+    @classmethod
+    def preflight(cls, *commands: str):
+        """
+        Проверяет, что окружение подходит для работы: ОС - Linux,
+        процесс запущен от root, в системе есть systemd и перечисленные
+        утилиты. При несоответствии программа завершается с кодом 1.
+
+        Проверки утилит запускают внешние процессы, поэтому их результаты
+        кэшируются в `/run` до перезагрузки системы (по boot ID).
+
+        :param commands: Дополнительные утилиты, наличие которых
+        проверяется запуском `<утилита> --version`.
+        :type commands: str
+        """
+        try:
+            if platform.system() != "Linux":
+                raise SystemError("Система не соответствует требованиям")
+            elif os.geteuid():
+                raise PermissionError("Недостаточно прав для запуска")
+            required = {"systemctl", *commands} - cls._preflight_passed
+            if not required:
+                return
+            boot_id = cls._get_boot_id()
+            cls._preflight_passed |= cls._load_preflight_cache(boot_id)
+            required -= cls._preflight_passed
+            if not required:
+                return
+            for command in sorted(required):
+                if cls._run_quiet([command, "--version"]):
+                    raise SystemError(
+                        "В системе не обнаружено systemd" if command == "systemctl"
+                        else f"В системе не обнаружено {command}"
+                    )
+                cls._preflight_passed.add(command)
+            if boot_id:
+                cls._save_preflight_cache(boot_id, cls._preflight_passed)
+        except Exception as err:
+            print(err)
+            cls.exit(1)
 
     @classmethod
-    def _get_cpu_time(cls):
+    def _proc_file(cls, path: str) -> ProcFile:
+        """
+        Возвращает открытый файл procfs, создавая его при первом обращении.
+
+        :param path: Путь к файлу.
+        :type path: str
+        :rtype: ProcFile
         """
-        Внутренний метод для получения данных о времени работы CPU
+        proc_file = cls._proc_files.get(path)
+        if proc_file is None:
+            proc_file = cls._proc_files.setdefault(path, ProcFile(path))
+        return proc_file
+
+    @classmethod
+    def _get_cpu_times(cls) -> dict:
+        """
+        Внутренний метод для получения счётчиков времени работы CPU
         из `/proc/stat`.
 
-        :return: Кортеж из двух значений: время простоя (idle)
-        и общее время работы CPU (total).
-        :rtype: tuple[int, int]
+        :return: Словарь вида {"cpu": счётчики, "cpu0": счётчики, ...},
+        где счётчики - кортеж из полей `user nice system idle iowait
+        irq softirq steal` в тиках.
+        :rtype: dict
         """
-        with open("/proc/stat", "r") as file:
-            line = file.readline()
-            parts = line.split()
-            idle = int(parts[4])
-            total = sum(map(int, parts[1:8]))
-        return idle, total
+        return {
+            name.decode(): tuple(map(int, counters))
+            for name, *counters in cls._proc_file("/proc/stat").findall(_CPU_TIMES_RE)
+        }
+
+    @classmethod
+    def sample_cpu(cls) -> dict:
+        """
+        Снимает показания счётчиков CPU и вычисляет загрузку
+        с момента предыдущего снимка.
+
+        Первый снимок возвращает среднюю загрузку с момента загрузки системы.
+        Если с предыдущего снимка счётчики CPU не изменились
+        (вызовы чаще тика ядра), для него возвращается предыдущая загрузка.
+
+        :return: Словарь вида {"cpu": ntuple_cpuusage, "cpu0": ntuple_cpuusage, ...}.
+        :rtype: dict
+        """
+        times = cls._get_cpu_times()
+        with cls._cpu_lock:
+            prev = cls._cpu_times or {}
+            prev_stats = cls._cpu_stats or {}
+            stats = {}
+            for name, counters in times.items():
+                delta = [
+                    cur - old for cur, old in zip(counters, prev.get(name, (0,) * 8))
+                ]
+                elapsed = sum(delta)
+                if not elapsed:
+                    stats[name] = prev_stats.get(name) or ntuple_cpuusage(0.0, 0.0, 0.0, 0.0, 0.0, 100.0)
+                    # Счётчики не изменились: база для следующего снимка остаётся прежней
+                    times[name] = prev.get(name, counters)
+                    continue
+                user, nice, system, idle, iowait, irq, softirq, steal = (
+                    d / elapsed * 100 for d in delta
+                )
+                stats[name] = ntuple_cpuusage(
+                    100 - idle - iowait, user + nice, system + irq + softirq, iowait, steal, idle,
+                )
+            cls._cpu_times = times
+            cls._cpu_stats = stats
+        return stats
+
+    @classmethod
+    def get_cpu_stats(cls):
+        """
+        Возвращает загрузку CPU в целом и по ядрам.
+
+        Загрузка вычисляется между текущим и предыдущим вызовом, без ожидания.
+
+        :return: Словарь вида {"cpu": ntuple_cpuusage, "cpu0": ntuple_cpuusage, ...}
+        с полями в процентах:
+            - `total`: Общая загрузка (всё, кроме idle и iowait).
+            - `user`: Время пользовательских процессов (включая nice).
+            - `system`: Время ядра (включая обработку прерываний).
+            - `iowait`: Ожидание ввода-вывода.
+            - `steal`: Время, отнятое гипервизором.
+            - `idle`: Простой.
+        :rtype: dict
+        """
+        try:
+            return cls.sample_cpu()
+        except Exception as err:
+            msg = "не удалось получить данные о загрузке процессора"
+            logging.error(f"{cls.__name__}:get_cpu_stats: {msg}: {err}")
 
     @classmethod
     def get_cpu_usage(cls):
@@ -91,20 +283,38 @@ class System:
         :return: Загрузка CPU в процентах (от 0 до 100).
         :rtype: float
         """
+        stats = cls.get_cpu_stats()
+        if stats:
+            return stats["cpu"].total
+
+    @classmethod
+    def get_mem_info(cls):
+        """
+        Возвращает показатели оперативной памяти из `/proc/meminfo`.
+
+        Поля разбираются по именам, отсутствующие в ядре поля равны 0.
+
+        :return: Именованный кортеж с полями `total free available buffers
+        cached shmem sreclaimable swap_total swap_free` (в байтах).
+        :rtype: ntuple_meminfo
+        """
         try:
-            idle, total = cls._get_cpu_time()
-            time.sleep(0.1)
-            idle2, total2 = cls._get_cpu_time()
-            return (1 - (idle2 - idle) / (total2 - total)) * 100
+            values = [0] * len(ntuple_meminfo._fields)
+            for name, value in cls._proc_file("/proc/meminfo").findall(_MEMINFO_RE):
+                values[_MEMINFO_FIELDS[name]] = int(value) << 10
+            return ntuple_meminfo._make(values)
         except Exception as err:
-            msg = "не удалось получить данные о загрузке процессора"
-            logging.error(f"{cls.__name__}:get_cpu_usage: {msg}: {err}")
+            msg = "не удалось получить данные об оперативной памяти"
+            logging.error(f"{cls.__name__}:get_mem_info: {msg}: {err}")
 
     @classmethod
     def get_mem_usage(cls):
         """
         Возвращает информацию об использовании оперативной памяти.
 
+        Свободной считается доступная для новых процессов память
+        (`MemAvailable`), включая освобождаемые кэши.
+
         :return: Именованный кортеж с полями:
             - `total`: Общий объем памяти (в байтах).
             - `used`: Используемый объем памяти (в байтах).
@@ -112,17 +322,12 @@ class System:
         :rtype: ntuple_memusage
         """
         try:
-            with open("/proc/meminfo", "r") as file:
-                lines = tuple(
-                    map(
-                        lambda x: int(x.split()[1]) * 2**10,
-                        file.readlines()[:5],
-                    )
-                )
-            total, free = lines[:2]
-            buff_cache = sum(lines[3:5])
-            used = total - free - buff_cache
-            return ntuple_memusage(total, used, total - used)
+            info = cls.get_mem_info()
+            available = info.available
+            if not available:
+                # Ядра старше 3.14 не сообщают MemAvailable
+                available = info.free + info.buffers + info.cached + info.sreclaimable - info.shmem
+            return ntuple_memusage(info.total, info.total - available, available)
         except Exception as err:
             msg = "не удалось получить данные об использовании оперативной памяти"
             logging.error(f"{cls.__name__}:get_mem_usage: {msg}: {err}")
@@ -200,62 +405,380 @@ class System:
             logging.error(f"{cls.__name__}:get_file_size: {msg}: {err}")
 
     @classmethod
-    def isusedfile(cls, path: str) -> bool:
+    def _iter_proc_fds(cls):
+        """
+        Внутренний генератор для обхода файловых дескрипторов
+        всех процессов в `/proc/*/fd`.
+
+        Процессы, завершившиеся во время обхода, а также недоступные
+        каталоги дескрипторов пропускаются.
+
+        :return: Кортежи вида (pid, номер дескриптора, путь к дескриптору).
+        :rtype: Iterator[tuple[int, int, str]]
+        """
+        with os.scandir("/proc") as procs:
+            for proc in procs:
+                if not proc.name.isdigit():
+                    continue
+                try:
+                    with os.scandir(f"{proc.path}/fd") as fds:
+                        for fd in fds:
+                            yield int(proc.name), int(fd.name), fd.path
+                except (FileNotFoundError, PermissionError, ProcessLookupError):
+                    continue
+
+    @classmethod
+    def get_used_files(cls) -> dict:
+        """
+        Возвращает индекс файлов, открытых какими-либо процессами.
+
+        Индекс строится за один проход по `/proc/*/fd` без вызова
+        внешних утилит, поэтому его стоит получать один раз на всю пачку
+        проверок и передавать в `isusedfile`.
+
+        :return: Словарь вида {(st_dev, st_ino): [(pid, fd), ...]}
+        для всех открытых обычных файлов.
+        :rtype: dict
+        """
+        used_files = {}
+        for pid, fd, fdpath in cls._iter_proc_fds():
+            try:
+                fd_stat = os.stat(fdpath)
+            except OSError:
+                continue
+            if stat.S_ISREG(fd_stat.st_mode):
+                used_files.setdefault(
+                    (fd_stat.st_dev, fd_stat.st_ino), []
+                ).append((pid, fd))
+        return used_files
+
+    @classmethod
+    def _get_proc_comm(cls, pid: int) -> str:
+        try:
+            with open(f"/proc/{pid}/comm", "r") as file:
+                return file.read().strip()
+        except OSError:
+            return "?"
+
+    @classmethod
+    def get_deleted_files(cls, prefixes=None) -> list:
+        """
+        Возвращает удалённые файлы, которые всё ещё открыты процессами.
+
+        Место, занятое такими файлами, не освобождается до закрытия
+        последнего дескриптора: `get_disk_usage` его учитывает,
+        а `get_dir_size` - уже нет.
+
+        :param prefixes: Учитывать только файлы, лежащие в одной
+        из директорий-префиксов (по-умолчанию - все). Пустой набор
+        префиксов не подходит ни одному файлу.
+        :type prefixes: Iterable[str]
+        :return: Список открытых дескрипторов удалённых файлов,
+        inode - пара (st_dev, st_ino), size - занятое файлом место в байтах.
+        :rtype: list[ntuple_deletedfile]
+        """
+        if prefixes is not None:
+            # Префикс сравнивается по компонентам пути:
+            # "/var/log/mplc4" не должен совпадать с "/var/log/mplc4-old"
+            prefixes = tuple(prefix.rstrip("/") for prefix in prefixes)
+            if not prefixes:
+                return []
+            prefix_dirs = tuple(prefix + "/" for prefix in prefixes)
+        deleted_files = []
+        comms = {}
+        for pid, fd, fdpath in cls._iter_proc_fds():
+            try:
+                target = os.readlink(fdpath)
+                if not target.endswith(" (deleted)"):
+                    continue
+                path = target[:-len(" (deleted)")]
+                if prefixes is not None and not (
+                    path in prefixes or path.startswith(prefix_dirs)
+                ):
+                    continue
+                fd_stat = os.stat(fdpath)
+            except OSError:
+                continue
+            if not stat.S_ISREG(fd_stat.st_mode):
+                continue
+            if pid not in comms:
+                comms[pid] = cls._get_proc_comm(pid)
+            deleted_files.append(ntuple_deletedfile(
+                pid, comms[pid], fd, path,
+                (fd_stat.st_dev, fd_stat.st_ino), fd_stat.st_blocks * 512,
+            ))
+        return deleted_files
+
+    @classmethod
+    def get_deleted_size(cls, prefixes=None) -> int:
+        """
+        Возвращает суммарный объём, занятый удалёнными, но открытыми файлами.
+        Файл, открытый несколькими дескрипторами, учитывается один раз.
+
+        :param prefixes: См. `get_deleted_files`.
+        :type prefixes: Iterable[str]
+        :rtype: int
+        """
+        sizes = {
+            deleted_file.inode: deleted_file.size
+            for deleted_file in cls.get_deleted_files(prefixes)
+        }
+        return sum(sizes.values())
+
+    @classmethod
+    def reclaim_deleted_files(cls, prefixes) -> dict:
+        """
+        Освобождает место, занятое удалёнными, но открытыми файлами,
+        обрезая их до нулевого размера через `/proc/<pid>/fd/<fd>`.
+
+        Процессы сохраняют свои дескрипторы, но прежнее содержимое
+        файлов теряется. Файлы, отображённые процессами в память
+        (например, журналы systemd-journald), обрезать нельзя,
+        поэтому префиксы обязательны: при пустом наборе префиксов
+        ничего не обрезается.
+
+        :param prefixes: Обрабатывать только файлы, лежащие в одной
+        из директорий-префиксов.
+        :type prefixes: Iterable[str]
+        :return: Словарь вида {(pid, fd): освобождённый объём в байтах}.
+        :rtype: dict
+        """
+        _log_owner = f"{cls.__name__}:reclaim_deleted_files"
+        reclaimed = {}
+        if not prefixes:
+            return reclaimed
+        done = set()
+        for deleted_file in cls.get_deleted_files(prefixes):
+            if deleted_file.inode in done:
+                continue
+            try:
+                os.truncate(f"/proc/{deleted_file.pid}/fd/{deleted_file.fd}", 0)
+            except OSError as err:
+                logging.error(
+                    f"{_log_owner}: не удалось обрезать {deleted_file.path!r}"
+                    f" ({deleted_file.comm}[{deleted_file.pid}]): {err}"
+                )
+                continue
+            done.add(deleted_file.inode)
+            reclaimed[(deleted_file.pid, deleted_file.fd)] = deleted_file.size
+            logging.info(
+                f"{_log_owner}: {deleted_file.path!r} ({deleted_file.comm}"
+                f"[{deleted_file.pid}]): освобождено {deleted_file.size} байт"
+            )
+        return reclaimed
+
+    @classmethod
+    def get_fd_flags(cls, pid: int, fd: int):
+        """
+        Возвращает флаги открытия файлового дескриптора процесса
+        из `/proc/<pid>/fdinfo/<fd>`.
+
+        :return: Флаги (`os.O_*`) или `None`, если дескриптор уже закрыт.
+        :rtype: int
+        """
+        try:
+            with open(f"/proc/{pid}/fdinfo/{fd}", "r") as file:
+                for line in file:
+                    if line.startswith("flags:"):
+                        return int(line.split()[1], 8)
+        except OSError:
+            return None
+
+    @classmethod
+    def _libc(cls):
+        if cls._libc_handle is None:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fallocate = getattr(libc, "fallocate64", libc.fallocate)
+            fallocate.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64)
+            cls._libc_handle = libc
+            cls._fallocate = fallocate
+        return cls._libc_handle
+
+    @classmethod
+    def set_low_priority(cls):
+        """
+        Понижает приоритет текущего процесса: минимальный приоритет
+        планировщика CPU (nice 19) и класс ввода-вывода idle,
+        при котором процесс обращается к диску, только когда
+        диск не нужен другим процессам.
+
+        :return: `True`, если оба приоритета понижены, иначе `False`.
+        :rtype: bool
+        """
+        _log_owner = f"{cls.__name__}:set_low_priority"
+        try:
+            os.setpriority(os.PRIO_PROCESS, 0, 19)
+            syscall = _IOPRIO_SET_SYSCALLS.get(platform.machine())
+            if syscall is None:
+                raise OSError(f"ioprio_set не поддерживается на {platform.machine()}")
+            libc = cls._libc()
+            if libc.syscall(
+                syscall, IOPRIO_WHO_PROCESS, 0, IOPRIO_CLASS_IDLE << IOPRIO_CLASS_SHIFT
+            ):
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return True
+        except Exception as err:
+            logging.warning(f"{_log_owner}: не удалось понизить приоритет: {err}")
+            return False
+
+    @classmethod
+    def truncate_head(cls, path: str, keep_tail: int = 0):
+        """
+        Освобождает место, занятое началом файла, оставляя последние
+        `keep_tail` байт. Подходит для файлов, которые процессы
+        продолжают дописывать.
+
+        Начало файла освобождается пробиванием дыры (`FALLOC_FL_PUNCH_HOLE`)
+        с сохранением размера, поэтому смещения пишущих процессов
+        остаются корректными. Если файловая система это не поддерживает
+        и `keep_tail` равен 0, файл обрезается до нулевого размера.
+
+        :param path: Путь к файлу.
+        :type path: str
+        :param keep_tail: Сколько последних байт файла сохранить.
+        :type keep_tail: int
+        :return: Освобождённый объём в байтах или `None` при ошибке.
+        :rtype: int
+        """
+        _log_owner = f"{cls.__name__}:truncate_head"
+        try:
+            cls._check_is_file(path)
+            cls._libc()
+            fd = os.open(path, os.O_WRONLY | os.O_CLOEXEC)
+            try:
+                file_stat = os.fstat(fd)
+                length = file_stat.st_size - keep_tail
+                length -= length % file_stat.st_blksize
+                if length <= 0:
+                    return 0
+                mode = FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE
+                if cls._fallocate(fd, mode, 0, length):
+                    errno = ctypes.get_errno()
+                    if keep_tail:
+                        raise OSError(errno, os.strerror(errno))
+                    os.ftruncate(fd, 0)
+                return (file_stat.st_blocks - os.fstat(fd).st_blocks) * 512
+            finally:
+                os.close(fd)
+        except Exception as err:
+            logging.error(f"{_log_owner}: не удалось освободить место файла {path!r}: {err}")
+
+    @classmethod
+    def isusedfile(cls, path: str, used_files: dict = None) -> bool:
         """
         Проверяет, используется ли файл каким-либо процессом.
 
         :param path: Путь к файлу.
         :type path: str
+        :param used_files: Индекс открытых файлов, полученный
+        из `get_used_files`. Если не передан, строится заново.
+        :type used_files: dict
         :return: `True`, если файл используется, иначе `False`.
         :rtype: bool
         """
         try:
             cls._check_is_file(path)
-            sp.run(
-                ["sudo", "lsof", path],
-                stdout = sp.DEVNULL,
-                stderr = sp.DEVNULL,
-                check = True,
-            )
-            return True
-        except sp.CalledProcessError as err:
-            return False
+            if used_files is None:
+                used_files = cls.get_used_files()
+            file_stat = os.stat(path)
+            return (file_stat.st_dev, file_stat.st_ino) in used_files
         except Exception as err:
             msg = "не удалось проверить использование файла"
             logging.error(f"{cls.__name__}:isusedfile: {msg}: {err}")
             return False
 
     @classmethod
-    def get_dir_size(cls, path: str):
+    def _list_dir(cls, path: str):
+        """
+        Внутренний метод для получения содержимого директории
+        через индекс `_dir_index`.
+
+        Директория перечитывается через `os.scandir`, только если
+        изменилось её время модификации (добавление, удаление
+        или переименование записей). Записи индекса исчезнувших
+        поддиректорий удаляются.
+
+        :param path: Путь к директории.
+        :type path: str
+        :return: Кортеж из занятого самой директорией места в байтах,
+        имён файлов и имён поддиректорий.
+        :rtype: tuple[int, tuple[str], tuple[str]]
+        """
+        dir_stat = os.stat(path)
+        cached = cls._dir_index.get(path)
+        if cached is not None and cached[0] == dir_stat.st_mtime_ns:
+            return cached[1:]
+        files, dirs = [], []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry.name)
+        if cached is not None:
+            for name in set(cached[3]).difference(dirs):
+                prefix = os.path.join(path, name)
+                for key in tuple(cls._dir_index):
+                    if key == prefix or key.startswith(prefix + os.sep):
+                        del cls._dir_index[key]
+        cls._dir_index[path] = (
+            dir_stat.st_mtime_ns,
+            dir_stat.st_blocks * 512,
+            tuple(files),
+            tuple(dirs),
+        )
+        return cls._dir_index[path][1:]
+
+    @classmethod
+    def get_dir_size(cls, path: str, allocated: bool = False):
         """
         Возвращает общий размер директории в байтах.
 
+        Содержимое директорий кэшируется и перечитывается только
+        при изменении их времени модификации, размеры файлов
+        запрашиваются при каждом вызове.
+
         :param path: Путь к директории.
         :type path: str
+        :param allocated: Считать занятые на диске блоки (`st_blocks`)
+        вместо размеров файлов, жёсткие ссылки учитываются один раз.
+        Результат совпадает с выводом команды `du`.
+        :type allocated: bool
         :return: Общий размер директории в байтах.
         :rtype: int
         """
         try:
             cls._check_is_dir(path)
-
-            # Стандартные средства ЯП
-            # BUG Размеры отличаются от тех, что выводит команда du
+            path = os.path.abspath(path)
             total_size = 0
-            for dirpath, _, filenames in os.walk(path):
+            seen_inodes = set()
+            pending = [path]
+            while pending:
+                dirpath = pending.pop()
+                try:
+                    dir_size, filenames, dirnames = cls._list_dir(dirpath)
+                except (FileNotFoundError, NotADirectoryError):
+                    cls._dir_index.pop(dirpath, None)
+                    continue
+                if allocated:
+                    total_size += dir_size
                 for filename in filenames:
-                    filepath = os.path.join(dirpath, filename)
-                    size = cls.get_file_size(filepath)
-                    if size:
-                        total_size += size
+                    try:
+                        file_stat = os.lstat(os.path.join(dirpath, filename))
+                    except FileNotFoundError:
+                        continue
+                    if not allocated:
+                        total_size += file_stat.st_size
+                        continue
+                    if file_stat.st_nlink > 1:
+                        inode = (file_stat.st_dev, file_stat.st_ino)
+                        if inode in seen_inodes:
+                            continue
+                        seen_inodes.add(inode)
+                    total_size += file_stat.st_blocks * 512
+                pending.extend(os.path.join(dirpath, name) for name in dirnames)
             return total_size
-
-            # Системная команда
-            # cmd = sp.run(["du", "-b", path], check=True, stdout=sp.PIPE)
-            # if cmd.stdout:
-            #     return int(cmd.stdout.split()[0])
-            # else:
-            #     raise ValueError("вывод команды пуст")
-
         except Exception as err:
             msg = "не удалось получить данные о размере директории"
             logging.error(f"{cls.__name__}:get_dir_size: {msg}: {err}")
@@ -321,23 +844,93 @@ class System:
         """
         Возвращает объект SystemService для управления службой.
 
+        Объекты кэшируются, поэтому проверка существования службы
+        выполняется только при первом запросе.
+
         :param name: Имя службы.
         :type name: str
         :return: Объект SystemService для управления службой.
         :rtype: SystemService
         """
-        return SystemService._create(name)
+        key = name if name.endswith(".service") else name + ".service"
+        if key not in cls._services:
+            cls._services[key] = SystemService._create(key)
+        return cls._services[key]
 
     @classmethod
-    def get_journal_size(cls):
+    def get_services_statuses(cls, services) -> dict:
+        """
+        Возвращает состояния нескольких служб одним запросом к systemd.
+
+        :param services: Службы, состояние которых нужно получить.
+        :type services: Iterable[SystemService]
+        :return: Словарь вида {имя службы: ntuple_servicestatus}.
+        :rtype: dict
+        """
+        return SystemService.get_statuses(services)
+
+    @classmethod
+    def get_journal_size(cls, allocated: bool = False):
         """
         Возвращает общий размер системного журнала,
         расположенного в директории /var/log.
 
+        Директории журнала перечитываются только при появлении
+        или удалении файлов, для каждого файла выполняется один `lstat`.
+
+        :param allocated: Вернуть занятое журналом место на диске,
+        как в выводе `journalctl --disk-usage`, вместо суммы размеров файлов.
+        :type allocated: bool
         :return: Общий размер журнала в байтах.
         :rtype: int
         """
-        return cls.get_dir_size(SYS_LOG_PATH)
+        return cls.get_dir_size(SYS_LOG_PATH, allocated)
+
+    @classmethod
+    def vacuum_journal_size(cls, max_size: int, max_files: int = None):
+        """
+        Очищает системный журнал за один вызов `journalctl`,
+        удаляя архивные файлы журнала, пока он занимает больше
+        указанного объёма.
+
+        Активные файлы журнала не удаляются, поэтому итоговый
+        размер может превышать `max_size`.
+
+        :param max_size: Допустимый объём журнала на диске в байтах.
+        :type max_size: int
+        :param max_files: Допустимое количество архивных файлов журнала
+        (`--vacuum-files`), если требуется ограничить и его.
+        :type max_files: int
+        :return: Освобождённый объём в байтах или `None` при ошибке.
+        :rtype: int
+        """
+        _log_owner = f"{cls.__name__}:vacuum_journal_size"
+        try:
+            if not isinstance(max_size, int) or max_size < 0:
+                raise TypeError("параметр max_size может быть только неотрицательным int")
+            args = ["sudo", "journalctl", f"--vacuum-size={max_size}"]
+            if max_files is not None:
+                args.append(f"--vacuum-files={int(max_files)}")
+            size_before = cls.get_journal_size(allocated=True)
+            Scheduler.run_process(
+                args,
+                check = True,
+                stdout = sp.DEVNULL,
+                stderr = sp.PIPE,
+                text = True,
+            )
+            size_after = cls.get_journal_size(allocated=True)
+            if size_before is None or size_after is None:
+                return None
+            logging.info(f"{_log_owner}: освобождено {size_before - size_after} байт")
+            return size_before - size_after
+        except TypeError as err:
+            logging.error(f"{_log_owner}: {err}")
+        except sp.CalledProcessError as err:
+            msg = "ненулевой код возврата команды"
+            logging.error(f"{_log_owner}: {msg} - {err.returncode}: {err.stderr}")
+        except Exception as err:
+            logging.exception(f"{_log_owner}: неизвестная ошибка: {err}")
 
     @classmethod
     def vacuum_journal(cls, timestamp: int) -> bool:
@@ -355,7 +948,7 @@ class System:
         try:
             if not isinstance(timestamp, int):
                 raise TypeError("параметр timestamp может быть только типа int")
-            sp.run(
+            Scheduler.run_process(
                 ["sudo", "journalctl", "--vacuum-time=" + f"{timestamp}s"],
                 check = True,
                 stdout = sp.DEVNULL,
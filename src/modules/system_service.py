@@ -1,5 +1,27 @@
+import asyncio
+import collections
+import glob
 import logging
+import os
+import re
 import subprocess as sp
+import time
+
+from .procfs import ProcFile
+from .scheduler import Scheduler
+
+ntuple_servicestatus = collections.namedtuple(
+    "ServiceStatus", "load active sub main_pid"
+)
+ntuple_cgroupstats = collections.namedtuple(
+    "CgroupStats",
+    "cpu_usec memory_current memory_peak io_rbytes io_wbytes"
+    " cpu_pressure memory_pressure io_pressure",
+)
+_CGROUP_USAGE_RE = re.compile(rb"^usage_usec (\d+)", re.MULTILINE)
+_CGROUP_VALUE_RE = re.compile(rb"^(\d+)")
+_CGROUP_IO_RE = re.compile(rb"rbytes=(\d+) wbytes=(\d+)")
+_CGROUP_PSI_RE = re.compile(rb"^some avg10=([\d.]+)", re.MULTILINE)
 
 
 class ServiceExistError(Exception):
@@ -17,6 +39,10 @@ class SystemService:
     """
 
     _VALID_ACTIONS = ("start", "stop", "restart")
+    _SHOW_PROPERTIES = ("LoadState", "ActiveState", "SubState", "MainPID")
+    _CGROUP_FS = "/sys/fs/cgroup"
+    _CGROUP_ROOT = "/sys/fs/cgroup/system.slice"
+    _CGROUP_RESOLVE_INTERVAL = 60.0
 
     def __init__(self, *args, **kwargs):
         """
@@ -43,11 +69,100 @@ class SystemService:
         if not obj._service_exists():
             raise ServiceExistError(f"службы {obj._name!r} не существует")
         obj._log_owner = f"{obj.__class__.__name__}:{obj._name}"
+        obj._cgroup_files = {}
+        obj._cgroup_dirs = ()
+        obj._cgroup_resolved = float("-inf")
         return obj
 
     def __repr__(self):
         return f"{self.__class__.__name__}(name={self._name!r})"
 
+    @classmethod
+    def _show_args(cls, names: list) -> list:
+        """
+        Возвращает аргументы команды `systemctl show` для получения
+        состояний перечисленных служб.
+        """
+        return [
+            "sudo", "systemctl", "show",
+            "-p", ",".join(cls._SHOW_PROPERTIES),
+            *names,
+        ]
+
+    @classmethod
+    def _parse_show(cls, names: list, stdout: str) -> dict:
+        """
+        Разбирает вывод `systemctl show` в словарь состояний служб.
+
+        Блоки свойств разделены пустой строкой и идут в порядке аргументов.
+        """
+        statuses = dict.fromkeys(names)
+        blocks = stdout.strip().split("\n\n")
+        for name, block in zip(names, blocks):
+            props = dict(
+                line.split("=", 1) for line in block.splitlines() if "=" in line
+            )
+            statuses[name] = ntuple_servicestatus(
+                props.get("LoadState"),
+                props.get("ActiveState"),
+                props.get("SubState"),
+                int(props.get("MainPID") or 0),
+            )
+        return statuses
+
+    @classmethod
+    def get_statuses(cls, services) -> dict:
+        """
+        Возвращает состояния нескольких служб одним вызовом `systemctl show`.
+
+        :param services: Службы, состояние которых нужно получить.
+        :type services: Iterable[SystemService]
+        :return: Словарь вида {имя службы: ntuple_servicestatus}.
+        Для служб, состояние которых получить не удалось, значение - `None`.
+        :rtype: dict
+        """
+        names = [service.name for service in services]
+        if not names:
+            return {}
+        try:
+            cmd = Scheduler.run_process(
+                cls._show_args(names),
+                stdout = sp.PIPE,
+                text = True,
+                check = True,
+            )
+            return cls._parse_show(names, cmd.stdout)
+        except Exception as err:
+            logging.error(f"{cls.__name__}:get_statuses: ошибка проверки статусов: {err}")
+            return dict.fromkeys(names)
+
+    @classmethod
+    async def get_statuses_async(cls, services) -> dict:
+        """
+        Асинхронный вариант `get_statuses`, не блокирующий цикл событий.
+
+        :param services: Службы, состояние которых нужно получить.
+        :type services: Iterable[SystemService]
+        :return: Словарь вида {имя службы: ntuple_servicestatus}.
+        :rtype: dict
+        """
+        names = [service.name for service in services]
+        if not names:
+            return {}
+        proc = await asyncio.create_subprocess_exec(
+            *cls._show_args(names),
+            stdout = asyncio.subprocess.PIPE,
+            stderr = asyncio.subprocess.DEVNULL,
+        )
+        try:
+            stdout, _ = await proc.communicate()
+        except asyncio.CancelledError:
+            proc.kill()
+            raise
+        if proc.returncode:
+            raise sp.CalledProcessError(proc.returncode, "systemctl show")
+        return cls._parse_show(names, stdout.decode())
+
     def _service_exists(self) -> bool:
         """
         Проверяет, существует ли служба в системе.
@@ -55,12 +170,8 @@ class SystemService:
         :return: `True`, если служба существует, иначе `False`.
         :rtype: bool
         """
-        result = sp.run(
-            ["sudo", "systemctl", "show", "-p", "LoadState", self._name],
-            stdout=sp.PIPE,
-            text=True
-        )
-        return "LoadState=loaded" in result.stdout
+        status = self.get_statuses((self,))[self._name]
+        return status is not None and status.load == "loaded"
 
     @property
     def name(self) -> str:
@@ -72,6 +183,20 @@ class SystemService:
         """
         return self._name
 
+    @property
+    def status(self):
+        """
+        Возвращает подробное состояние службы.
+
+        :return: Именованный кортеж с полями:
+            - `load`: Состояние загрузки (`LoadState`).
+            - `active`: Состояние активности (`ActiveState`).
+            - `sub`: Детальное состояние (`SubState`).
+            - `main_pid`: PID основного процесса (0, если его нет).
+        :rtype: ntuple_servicestatus
+        """
+        return self.get_statuses((self,))[self._name]
+
     @property
     def state(self):
         """
@@ -80,13 +205,118 @@ class SystemService:
         :return: Состояние службы (например, `active`, `inactive`, `failed`).
         :rtype: str
         """
-        _log_owner = f"{self._log_owner}:state"
+        status = self.status
+        return status.active if status else None
+
+    def _cgroup_populated(self, path: str) -> bool:
+        try:
+            with open(f"{path}/cgroup.events", "r") as file:
+                return "populated 1" in file.read()
+        except OSError:
+            return False
+
+    def _resolve_cgroups(self) -> tuple:
+        """
+        Определяет директории cgroup v2, в которых работают процессы службы.
+
+        Используется свойство `ControlGroup` службы. Если в её cgroup
+        нет процессов (например, `postgresql.service` в Debian - обёртка
+        без процессов, а сервер работает как `postgresql@<версия>-main.service`),
+        используются cgroup экземпляров `<служба>@*.service`.
+        Результат кэшируется, повторно `systemctl` вызывается только
+        если cgroup исчезли, и не чаще раза в `_CGROUP_RESOLVE_INTERVAL` секунд.
+
+        :return: Пути к директориям cgroup.
+        :rtype: tuple[str]
+        """
+        dirs = self._cgroup_dirs
+        if dirs and all(os.path.isdir(path) for path in dirs):
+            return dirs
+        now = time.monotonic()
+        if now - self._cgroup_resolved < self._CGROUP_RESOLVE_INTERVAL:
+            return dirs
+        self._cgroup_resolved = now
         try:
-            cmd_args = ["sudo", "systemctl", "is-active", self._name]
-            cmd = sp.run(cmd_args, stdout=sp.PIPE, text=True)
-            return cmd.stdout.strip()
+            control_group = Scheduler.run_process(
+                ["sudo", "systemctl", "show", "-p", "ControlGroup", "--value", self._name],
+                stdout = sp.PIPE,
+                text = True,
+                check = True,
+            ).stdout.strip()
         except Exception as err:
-            logging.exception(f"{_log_owner}: ошибка проверки статуса")
+            logging.error(f"{self._log_owner}: не удалось определить cgroup: {err}")
+            control_group = ""
+        path = f"{self._CGROUP_FS}{control_group}"
+        if control_group and self._cgroup_populated(path):
+            dirs = (path,)
+        else:
+            stem = self._name[:-len(".service")]
+            dirs = tuple(
+                instance for instance in sorted(glob.glob(f"{self._CGROUP_ROOT}/{stem}@*.service"))
+                if self._cgroup_populated(instance)
+            )
+        self._cgroup_dirs = dirs
+        return dirs
+
+    def _read_cgroup(self, path: str, pattern: re.Pattern) -> list:
+        """
+        Читает файл cgroup через постоянно открытый дескриптор.
+
+        :return: Группы совпадений `pattern` или пустой список,
+        если файл отсутствует (служба остановлена или счётчик
+        не поддерживается ядром).
+        :rtype: list
+        """
+        cgroup_file = self._cgroup_files.get(path)
+        if cgroup_file is None:
+            cgroup_file = self._cgroup_files[path] = ProcFile(path, 1024)
+        try:
+            return cgroup_file.findall(pattern)
+        except OSError:
+            cgroup_file.close()
+            return []
+
+    def _read_cgroup_values(self, dirs: tuple, name: str, pattern: re.Pattern = _CGROUP_VALUE_RE, type=int) -> list:
+        values = (self._read_cgroup(f"{path}/{name}", pattern) for path in dirs)
+        return [type(value[0]) for value in values if value]
+
+    @property
+    def cgroup_stats(self):
+        """
+        Возвращает потребление ресурсов службой из её cgroup v2,
+        читая `/sys/fs/cgroup` напрямую. Если процессы службы работают
+        в нескольких экземплярах (`<служба>@*.service`), показатели
+        суммируются, давление ресурсов берётся максимальное.
+
+        :return: Именованный кортеж с полями:
+            - `cpu_usec`: Суммарное время CPU (в микросекундах).
+            - `memory_current`: Используемая память (в байтах).
+            - `memory_peak`: Пиковое использование памяти (в байтах,
+            `None`, если ядро его не сообщает).
+            - `io_rbytes`, `io_wbytes`: Прочитано и записано с дисков (в байтах).
+            - `cpu_pressure`, `memory_pressure`, `io_pressure`: Доля времени
+            за последние 10 сек., в течение которой процессы службы простаивали
+            из-за нехватки ресурса (PSI `some avg10`, в процентах).
+        Если cgroup службы нет (служба не запущена или система
+        использует cgroup v1), возвращается `None`.
+        :rtype: ntuple_cgroupstats
+        """
+        dirs = self._resolve_cgroups()
+        if not dirs:
+            return None
+        total = lambda values: sum(values) if values else None
+        peak = lambda values: max(values) if values else None
+        io = [row for path in dirs for row in self._read_cgroup(f"{path}/io.stat", _CGROUP_IO_RE)]
+        return ntuple_cgroupstats(
+            total(self._read_cgroup_values(dirs, "cpu.stat", _CGROUP_USAGE_RE)),
+            total(self._read_cgroup_values(dirs, "memory.current")),
+            total(self._read_cgroup_values(dirs, "memory.peak")),
+            sum(int(rbytes) for rbytes, _ in io),
+            sum(int(wbytes) for _, wbytes in io),
+            peak(self._read_cgroup_values(dirs, "cpu.pressure", _CGROUP_PSI_RE, float)),
+            peak(self._read_cgroup_values(dirs, "memory.pressure", _CGROUP_PSI_RE, float)),
+            peak(self._read_cgroup_values(dirs, "io.pressure", _CGROUP_PSI_RE, float)),
+        )
 
     def isactive(self) -> bool:
         """
@@ -117,7 +347,7 @@ class SystemService:
             return True
         try:
             cmd_args = ["sudo", "systemctl", action, self._name]
-            sp.run(cmd_args, check=True, timeout=timeout)
+            Scheduler.run_process(cmd_args, check=True, timeout=timeout)
             logging.info(f"{_log_owner}: команда успешно выполнена")
             return True
         except (sp.CalledProcessError, sp.TimeoutExpired) as err: